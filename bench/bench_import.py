@@ -0,0 +1,95 @@
+##
+# @file bench_import.py
+#
+# @brief Import time budget of the pyarcadia modules
+#
+# @section description_bench_import Description
+# Imports each pyarcadia module in a fresh interpreter, and checks that it
+# stays within the time budget and that it doesn't pull in the plotting and
+# fitting packages, which are only loaded on first use.
+#
+# Runs on the software emulator, no DAQ Board nor C++ module is needed:
+#
+#   python3 bench/bench_import.py
+#   python3 bench/bench_import.py -b 0.5 -o imports.json
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+MODULES = [
+    'pyarcadia.daq',
+    'pyarcadia.data',
+    'pyarcadia.sequence',
+    'pyarcadia.recording',
+    'pyarcadia.test',
+    'pyarcadia.tests.scan',
+    'pyarcadia.tests.baseline',
+    'pyarcadia.tests.threshold'
+]
+
+# Loaded on first use only
+LAZY = ['matplotlib', 'scipy', 'tabulate']
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'seconds': elapsed, 'loaded': [x for x in {lazy!r} if x in sys.modules]}}))
+"""
+
+def measure(module, repeat):
+    """Imports a module in fresh interpreters, returning the best time
+
+    :returns: Seconds, and the lazy packages which got loaded
+    :rtype: tuple(float, list)
+    """
+    env = dict(os.environ, PYARCADIA_EMULATOR=os.environ.get('PYARCADIA_EMULATOR', '1'))
+    cwd = os.path.abspath(os.path.join(__file__, "../.."))
+
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy=LAZY)],
+            capture_output=True, text=True, check=True, env=env, cwd=cwd).stdout
+        result = json.loads(out.splitlines()[-1])
+
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+
+    return best['seconds'], best['loaded']
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the import time of the pyarcadia modules')
+    parser.add_argument('-m', '--modules', nargs='+', default=MODULES, help='Modules to import')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions per module, the best is kept')
+    parser.add_argument('-b', '--budget', type=float, default=0.5, help='Maximum seconds to import each module')
+    parser.add_argument('-o', '--output', help='Optional JSON file to store the results in')
+    args = parser.parse_args()
+
+    failures = 0
+    results = []
+    for module in args.modules:
+        seconds, loaded = measure(module, args.repeat)
+
+        flags = []
+        if seconds > args.budget:
+            flags.append('OVER BUDGET')
+
+        if len(loaded) > 0:
+            flags.append('LOADS %s' % ', '.join(loaded))
+
+        failures += len(flags) > 0
+        print("%-30s %8.3f s %s" % (module, seconds, ' '.join(flags)))
+        results.append({'module': module, 'seconds': seconds, 'loaded': loaded})
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'budget': args.budget, 'results': results}, f, indent=2)
+
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
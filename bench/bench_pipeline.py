@@ -0,0 +1,312 @@
+##
+# @file bench_pipeline.py
+#
+# @brief Benchmarks of the decode -> sequence -> elaboration pipeline
+#
+# @section description_bench_pipeline Description
+# Generates synthetic FPGA packet streams, mimicking Threshold Scan runs,
+# and times the stages of the pyarcadia packet processing pipeline on them.
+# Results are stored as JSON, and can be compared against a previous run
+# to spot regressions.
+#
+# Runs on the software emulator, no DAQ Board nor C++ module is needed:
+#
+#   python3 bench/bench_pipeline.py -o results.json
+#   python3 bench/bench_pipeline.py -o new.json --compare results.json
+
+import os
+import sys
+import gc
+import json
+import time
+import math
+import argparse
+import datetime
+import platform
+import subprocess
+import numpy as np
+from tabulate import tabulate
+
+os.environ.setdefault('PYARCADIA_EMULATOR', '1')
+sys.path.insert(0, os.path.abspath(os.path.join(__file__, "../..")))
+
+from pyarcadia.daq import Chip
+from pyarcadia.data import FPGAData
+from pyarcadia.emulator import pack_hits
+from pyarcadia.sequence import Sequence, SubSequence
+from pyarcadia.tests.scan import ScanResult
+from pyarcadia.tests.threshold import ThresholdScan
+
+SIZES = [int(1E3), int(1E4), int(1E5), int(1E6), int(1E7)]
+
+STREAM = {
+    'pixels': 64,
+    'injections': 200,
+    'fe_probability': 0.05,
+    'noise': 0.01,
+    'tp_period': 20,
+    'phase_gap': 100000,
+    'seed': 0
+}
+
+PHASE_WORD = 0xDEADBEEF
+
+def custom_word(message, payload=0):
+    return (0xc << 60) | ((message & 0xffffffffffff) << 8) | (payload & 0xff)
+
+def synthetic_stream(packets, pixels=64, injections=200, fe_probability=0.05, noise=0.01, tp_period=20, phase_gap=100000, seed=0):
+    """Generates the packets of a Threshold Scan-like run: phases of Test
+    Pulse trains injecting the same pixels, each terminated by a Custom Word.
+
+    :param int packets: Number of packets to generate
+    :param int pixels: Injected pixels
+    :param int injections: Test Pulses per phase
+    :param float fe_probability: Probability of a falling edge hit per injection
+    :param float noise: Random hits, as a fraction of the injected ones
+    :param int tp_period: Test Pulse period, in timestamp ticks
+    :param int phase_gap: Idle ticks between phases
+    :param int seed: Random generator seed
+
+    :returns: Packets, and (rows, cols) of the injected pixels
+    :rtype: tuple
+    """
+    rng = np.random.default_rng(seed)
+    flat = rng.choice(512*512, pixels, replace=False)
+    rows, cols = flat >> 9, flat & 0x1ff
+
+    ticks = []
+    words = []
+    total = 0
+    tick = 0
+    phase = 0
+    while total < packets:
+        tp_ticks = tick + np.arange(injections, dtype=np.int64)*tp_period
+        tps = (np.uint64(0xa) << np.uint64(60)) | (tp_ticks & 0xffffff).astype(np.uint64)
+
+        hit_ticks = np.repeat(tp_ticks + 5, pixels)
+        hit_rows = np.tile(rows, injections)
+        hit_cols = np.tile(cols, injections)
+
+        # Falling edge hits
+        fe = rng.random(len(hit_ticks)) < fe_probability
+        hit_ticks = np.r_[hit_ticks, hit_ticks[fe] + tp_period//2]
+        hit_rows = np.r_[hit_rows, hit_rows[fe]]
+        hit_cols = np.r_[hit_cols, hit_cols[fe]]
+
+        # Random hits over the whole matrix
+        noisy = rng.poisson(noise*len(hit_ticks))
+        noisy_flat = rng.integers(0, 512*512, noisy)
+        hit_ticks = np.r_[hit_ticks, rng.integers(tick, tp_ticks[-1] + tp_period, noisy)]
+        hit_rows = np.r_[hit_rows, noisy_flat >> 9]
+        hit_cols = np.r_[hit_cols, noisy_flat & 0x1ff]
+
+        data_ticks, data = pack_hits(hit_ticks, hit_rows, hit_cols)
+
+        end = int(tp_ticks[-1]) + 2*tp_period
+        phase_ticks = np.r_[tp_ticks, data_ticks, end]
+        phase_words = np.r_[tps, data, np.uint64(custom_word(PHASE_WORD, phase % 64))]
+
+        order = np.argsort(phase_ticks, kind='stable')
+        ticks.append(phase_ticks[order])
+        words.append(phase_words[order])
+
+        total += len(phase_words)
+        tick = end + phase_gap
+        phase += 1
+
+    ticks = np.concatenate(ticks)
+    words = np.concatenate(words)
+
+    # FPGA timestamp overflows
+    wraps = np.arange(1, (ticks[-1] >> 24) + 1) << 24
+    words = np.insert(words, np.searchsorted(ticks, wraps), np.uint64(0xf << 60))
+
+    words = words[:packets]
+    words[-1] = custom_word(PHASE_WORD, 0)
+
+    return words, (rows, cols)
+
+# Stages: each prepares its inputs from a stream, and returns the callable to time
+def stage_fpga_elaborate(words, pixels):
+    packets = FPGAData.from_packets(words)
+    sequence = Sequence()
+
+    def run():
+        for packet in packets:
+            packet.elaborate(sequence)
+
+    return run
+
+def stage_sequence_elaborate(words, pixels):
+    packets = FPGAData.from_packets(words)
+    return lambda: Sequence().elaborate(packets)
+
+def stage_sequence_elaborate_parallel(words, pixels):
+    packets = FPGAData.from_packets(words)
+    return lambda: Sequence().elaborate_parallel(packets)
+
+def stage_sequence_elaborate_columnar(words, pixels):
+    return lambda: Sequence(columnar=True).elaborate(words)
+
+def stage_sequence_extend(words, pixels):
+    # As the autoreader does, one Sequence per FPGA readout
+    chunks = []
+    for start in range(0, len(words), 32768):
+        chunk = Sequence()
+        chunk.elaborate(FPGAData.from_packets(words[start:start+32768]))
+        chunks.append(chunk)
+
+    def run():
+        sequence = Sequence()
+        for chunk in chunks:
+            sequence.extend(chunk)
+
+    return run
+
+def stage_squash_data(words, pixels):
+    subsequence = SubSequence(FPGAData.from_packets(words))
+    return subsequence.squash_data
+
+def _parented_subsequence(words):
+    Chip.ts_us = 1
+    parent = Sequence(chip=True)
+    return SubSequence(FPGAData.from_packets(words), parent)
+
+def stage_filter_double_injections(words, pixels):
+    return _parented_subsequence(words).filter_double_injections
+
+_scan = None
+
+def stage_threshold_elab_phase2(words, pixels):
+    global _scan
+    if _scan is None:
+        _scan = ThresholdScan()
+
+    _scan.result = ScanResult(list(zip(pixels[0].tolist(), pixels[1].tolist())), len(_scan.range), _scan.fields)
+
+    subsequence = _parented_subsequence(words)
+    return lambda: _scan.elab_phase2(subsequence)
+
+STAGES = {
+    'FPGAData.elaborate': stage_fpga_elaborate,
+    'Sequence.elaborate': stage_sequence_elaborate,
+    'Sequence.elaborate_parallel': stage_sequence_elaborate_parallel,
+    'Sequence.elaborate[columnar]': stage_sequence_elaborate_columnar,
+    'Sequence.extend': stage_sequence_extend,
+    'SubSequence.squash_data': stage_squash_data,
+    'SubSequence.filter_double_injections': stage_filter_double_injections,
+    'ThresholdScan.elab_phase2': stage_threshold_elab_phase2,
+}
+
+def measure(stage, words, pixels, repeat):
+    """Times a stage, returning the best of the repetitions. Slow stages,
+    above one second, are run only once.
+    """
+    best = math.inf
+    runs = 0
+    while runs < repeat:
+        run = STAGES[stage](words, pixels)
+        gc.collect()
+
+        t0 = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - t0
+
+        best = min(best, elapsed)
+        runs += 1
+        if elapsed > 1:
+            break
+
+    return best, runs
+
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'date': datetime.datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'budget': args.budget,
+        'stream': STREAM
+    }
+
+def compare(results, reference, tolerance):
+    """Prints the ratio between the current and the reference timings
+
+    :returns: Number of regressions above tolerance
+    :rtype: int
+    """
+    old = {(x['stage'], x['packets']): x for x in reference['results'] if 'seconds' in x}
+
+    table = []
+    regressions = 0
+    for result in results:
+        key = (result['stage'], result['packets'])
+        if 'seconds' not in result or key not in old:
+            continue
+
+        ratio = result['seconds']/old[key]['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions += 1
+
+        table.append([result['stage'], result['packets'], old[key]['seconds'], result['seconds'], '%.2fx' % ratio, flag])
+
+    print(tabulate(table, headers=['Stage', 'Packets', 'Reference (s)', 'Current (s)', 'Ratio', '']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the pyarcadia packet processing pipeline')
+    parser.add_argument('-o', '--output', default='bench_pipeline.json', help='JSON file to store the results in')
+    parser.add_argument('-s', '--sizes', type=float, nargs='+', default=SIZES, help='Stream sizes, in packets')
+    parser.add_argument('-t', '--stages', nargs='+', default=list(STAGES), choices=list(STAGES), metavar='STAGE', help='Stages to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions per measurement, the best is kept')
+    parser.add_argument('-b', '--budget', type=float, default=60, help='Skip sizes expected to take longer than these seconds')
+    parser.add_argument('-c', '--compare', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Slowdown tolerated before flagging a regression')
+    args = parser.parse_args()
+
+    sizes = sorted(int(x) for x in args.sizes)
+    streams = {}
+
+    results = []
+    for stage in args.stages:
+        last = None
+        for size in sizes:
+            # Extrapolate linearly from the previous size
+            if last is not None and last[1]*size/last[0] > args.budget:
+                print("%-40s %10d packets: skipped, over budget" % (stage, size))
+                results.append({'stage': stage, 'packets': size, 'skipped': True})
+                continue
+
+            if size not in streams:
+                streams[size] = synthetic_stream(size, **STREAM)
+
+            seconds, runs = measure(stage, *streams[size], args.repeat)
+            last = (size, seconds)
+
+            print("%-40s %10d packets: %10.4f s %12.0f packets/s" % (stage, size, seconds, size/seconds))
+            results.append({'stage': stage, 'packets': size, 'seconds': seconds, 'packets_per_second': size/seconds, 'runs': runs})
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(args), 'results': results}, f, indent=2)
+
+    if args.compare is None:
+        return 0
+
+    with open(args.compare) as f:
+        reference = json.load(f)
+
+    return 1 if compare(results, reference, args.tolerance) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
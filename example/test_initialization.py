@@ -1,7 +1,8 @@
 import logging
 from pyarcadia.test import Test
 
-x = Test()
-x.initialize()
+if __name__ == '__main__':
+    x = Test()
+    x.initialize()
 
-x.set_timestamp_resolution(1E-6)
+    x.set_timestamp_resolution(1E-6)
@@ -15,10 +15,15 @@
 import os
 import time
 import math
+import contextlib
 import numpy as np
 
-from arcadia_daq import FPGAIf, ChipIf, set_ipbus_loglevel
+if os.environ.get('PYARCADIA_EMULATOR'):
+    from .emulator import FPGAIf, ChipIf, set_ipbus_loglevel
+else:
+    from arcadia_daq import FPGAIf, ChipIf, set_ipbus_loglevel
 from .data import FPGAData
+from .metrics import METRICS
 
 set_ipbus_loglevel(0)
 
@@ -110,11 +115,51 @@ class Chip:
         self.lanes_masked = []
         self.pcr = None
         self.track_pcr = False
+        self.transaction_depth = 0
+
+        METRICS.sampler('chip%d_fifo_overflow_count' % chip_id, self.packets_lost_count, delta=True)
+        METRICS.sampler('chip%d_fifo' % chip_id, self._fifo_stats, delta=True)
 
     def __getattr__(self, attr):
         return getattr(self.__chipif, attr)
 
-    def write_gcrpar(self, gcrpar, value):
+    @contextlib.contextmanager
+    def transaction(self):
+        """Context manager accumulating the GCR and ICR writes issued within it,
+        which are sent with the fewest IPbus dispatches when it exits. Reads flush
+        the writes queued so far. Transactions can be nested.
+
+        :raises RuntimeError: If the SPI transfers failed
+        """
+        if self.transaction_depth == 0:
+            self.__chipif.spi_transaction_begin()
+
+        self.transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self.transaction_depth -= 1
+            ret = 0 if self.transaction_depth > 0 else self.__chipif.spi_transaction_end()
+            if self.transaction_depth == 0:
+                METRICS.count('spi_transactions')
+
+        if ret != 0:
+            raise RuntimeError("SPI transaction failed")
+
+    @property
+    def gcr_write_changed_only(self):
+        """When True, GCR writes which wouldn't change the shadow registers
+        are skipped. The number of skipped writes is in gcr_writes_suppressed.
+
+        :rtype: bool
+        """
+        return self.__chipif.gcr_write_changed_only
+
+    @gcr_write_changed_only.setter
+    def gcr_write_changed_only(self, enable):
+        self.__chipif.gcr_write_changed_only = enable
+
+    def write_gcrpar(self, gcrpar, value, force=False):
         """Writes a GCR field
 
         :param gcrpar: GCR field name as in the ARCADIA Configuration file
@@ -122,10 +167,16 @@ class Chip:
 
         :param value: Value to be written in the GCR field
         :type value: int
+
+        :param force: Write even if the GCR already holds the value
+        :type force: bool
         """
         self.logger.debug("Writing GCR_PAR[%s] = 0x%x" % (gcrpar, value))
-        self.__chipif.write_gcrpar(gcrpar, value)
-        time.sleep(0.1E-3)
+        self.__chipif.write_gcrpar(gcrpar, value, force)
+        METRICS.count('spi_writes')
+
+        if self.transaction_depth == 0:
+            time.sleep(0.1E-3)
 
     def read_gcrpar(self, gcrpar, force_update=False):
         """Reads a GCR
@@ -137,6 +188,9 @@ class Chip:
         :type force_update: bool
         """
         ret, value = self.__chipif.read_gcrpar(gcrpar, force_update)
+        if force_update:
+            METRICS.count('spi_reads')
+
         return value
 
 
@@ -150,9 +204,12 @@ class Chip:
         :type force_update: bool
         """
         _, value = self.__chipif.read_gcr(gcr, force_update)
+        if force_update:
+            METRICS.count('spi_reads')
+
         return value
 
-    def write_gcr(self, gcr, value):
+    def write_gcr(self, gcr, value, force=False):
         """Writes a GCR
 
         :param gcr: GCR name as in the ARCADIA Configuration file
@@ -160,10 +217,16 @@ class Chip:
 
         :param value: Value to be written in the GCR
         :type value: int
+
+        :param force: Write even if the GCR already holds the value
+        :type force: bool
         """
         self.logger.debug("Writing GCR[%2d] = 0x%x" % (gcr, value))
-        self.__chipif.write_gcr(gcr, value)
-        time.sleep(0.1E-3)
+        self.__chipif.write_gcr(gcr, value, force)
+        METRICS.count('spi_writes')
+
+        if self.transaction_depth == 0:
+            time.sleep(0.1E-3)
 
     def write_icr(self, icr, value):
         """Writes an ICR
@@ -176,6 +239,7 @@ class Chip:
         """
         self.logger.debug("Writing ICR%1d = %x" % (icr, value))
         self.__chipif.write_icr('ICR%1d' % icr, value)
+        METRICS.count('spi_writes')
 
         if not self.track_pcr or icr != 0 or (value >> 8) & 0b1 == 0:
             return
@@ -261,6 +325,11 @@ class Chip:
         """
         return self.__chipif.fifo_overflow_count()
 
+    def _fifo_stats(self):
+        # A consistent set of the FIFO reader statistics, for METRICS
+        stats = self.__chipif.stats()
+        return {name: stats[name] for name in ('empty_polls', 'bytes_read', 'short_reads', 'max_packets_stalls', 'ring_full_stalls')}
+
     def packets_count(self):
         """Get the number of available data packets
 
@@ -280,6 +349,26 @@ class Chip:
         """
         return self.__chipif.packets_read(packets)
 
+    def packets_read_start(self, ring_size=None, pipelined=None):
+        """Starts the automatic readout of packets from the FPGA FIFO
+
+        :param ring_size: Optional, capacity in packets of the ring buffer the
+            reader thread fills. With a ring buffer, packets_read drains it without
+            stopping the reader thread. 0 restores the default double buffering
+        :type ring_size: int, optional
+
+        :param pipelined: Optional, read the FIFO data and the next occupancy
+            in a single IPbus dispatch
+        :type pipelined: bool, optional
+        """
+        if ring_size is not None:
+            self.__chipif.ring_size = ring_size
+
+        if pipelined is not None:
+            self.__chipif.pipelined_read = pipelined
+
+        return self.__chipif.packets_read_start()
+
     def packets_read_stop(self):
         """Stops the automatic readout of packets from the FPGA FIFO
         """
@@ -353,11 +442,13 @@ class Chip:
         """Sends a hard reset to the chip through the Reset pin.
         """
         self.send_controller_command('doRESET', 0x1)
+        self.__chipif.invalidate_gcr_cache()
 
     def soft_reset(self):
         """Sends a hard reset to the chip through ICR resets.
         """
         self.write_icr(0, 0x0015)
+        self.__chipif.invalidate_gcr_cache()
 
     def space_mode(self):
         """Configures the chip to operate in space mode. Only lane 0 will be activated.
@@ -400,6 +491,9 @@ class Chip:
         icr0 = (1 << bit) | ((1 << action) & 0x7)
         self.write_icr(0, icr0)
 
+        if subsystem in ('chip', 'gcr'):
+            self.__chipif.invalidate_gcr_cache()
+
     # Onehot/Onecold GCRs
     def gcr_onehot(self, gcr, value=0xffff, update=False):
         """Configures a GCR to a one-hot encoded value
@@ -600,38 +694,39 @@ class Chip:
         :param int|List[int] master: Master sub-PR or Slave
         :param int|List[int] pixels: Pixels in the sub-PR
         """
-        self.write_gcrpar('HELPER_SECCFG_SECTIONS', onehot(sections))
-        self.write_gcrpar('HELPER_SECCFG_COLUMNS', onehot(columns))
-
-        if prs is None:
-            prs = [[0, 127]]
-        elif isinstance(prs, int):
-            prs = [[prs]]
-
-        if master is None:
-            master = [0, 1]
-
-        for pr_range in prs:
-            if isinstance(pr_range, int):
-                range_start = pr_range
-                range_stop  = pr_range
-            elif isinstance(pr_range, list) and len(pr_range) == 1:
-                range_start = pr_range[0]
-                range_stop  = pr_range[0]
-            else:
-                range_start = pr_range[0]
-                range_stop  = pr_range[1]
-
-            self.write_gcrpar('HELPER_SECCFG_PRSTART', range_start)
-            self.write_gcrpar('HELPER_SECCFG_PRSKIP',  0)
-            self.write_gcrpar('HELPER_SECCFG_CFGDATA', cfg)
-            self.write_gcrpar('HELPER_SECCFG_PRSTOP',  range_stop)
-
-            master = [master] if not isinstance(master, list) else master
-            for subpr in master:
-                pselect = (subpr << 4) | (onehot(pixels) & 0xf)
-                self.write_gcrpar('HELPER_SECCFG_PIXELSELECT', pselect)
-                self.write_pcr()
+        with self.transaction():
+            self.write_gcrpar('HELPER_SECCFG_SECTIONS', onehot(sections))
+            self.write_gcrpar('HELPER_SECCFG_COLUMNS', onehot(columns))
+
+            if prs is None:
+                prs = [[0, 127]]
+            elif isinstance(prs, int):
+                prs = [[prs]]
+
+            if master is None:
+                master = [0, 1]
+
+            for pr_range in prs:
+                if isinstance(pr_range, int):
+                    range_start = pr_range
+                    range_stop  = pr_range
+                elif isinstance(pr_range, list) and len(pr_range) == 1:
+                    range_start = pr_range[0]
+                    range_stop  = pr_range[0]
+                else:
+                    range_start = pr_range[0]
+                    range_stop  = pr_range[1]
+
+                self.write_gcrpar('HELPER_SECCFG_PRSTART', range_start)
+                self.write_gcrpar('HELPER_SECCFG_PRSKIP',  0)
+                self.write_gcrpar('HELPER_SECCFG_CFGDATA', cfg)
+                self.write_gcrpar('HELPER_SECCFG_PRSTOP',  range_stop)
+
+                master = [master] if not isinstance(master, list) else master
+                for subpr in master:
+                    pselect = (subpr << 4) | (onehot(pixels) & 0xf)
+                    self.write_gcrpar('HELPER_SECCFG_PIXELSELECT', pselect)
+                    self.write_pcr()
 
     def pixels_mask(self, sections=0xffff, columns=0xffff, prs=None, master=None, pixels = 0xf):
         """Mask a set of pixels
@@ -713,3 +808,15 @@ class Chip:
 
     def readout(self, max_packets=32768):
         return FPGAData.from_packets(self.packets_read(max_packets))
+
+    def record_start(self, filename):
+        """Starts recording the packets read from the FPGA to a file, which
+        holds the chip id, the GCRs and the timestamp resolution in its header.
+        Recordings can be opened with recording.Recording.
+
+        :param str filename: File to record to
+        :raises RuntimeError: If the file can't be opened
+        """
+        ts_resolution = Chip.ts_us*1E-6 if Chip.ts_us is not None else 0
+        if self.__chipif.record_start(filename, ts_resolution) != 0:
+            raise RuntimeError("Unable to record packets to %s" % filename)
@@ -1,5 +1,42 @@
-import math
+import bisect
 from dataclasses import dataclass
+import numpy as np
+
+# Packet kinds in a decoded packet table
+KIND_DATA = 0
+KIND_TP = 1
+KIND_WORD = 2
+KIND_OVERFLOW = 3
+
+# Tags of the data packets, see tag_injections
+TAG_ISOLATED = 0
+TAG_RISING_EDGE = 1
+TAG_FALLING_EDGE = 2
+TAG_AMBIGUOUS = 3
+TAG_NAMES = ('isolated', 'rising edge', 'falling edge', 'ambiguous')
+
+# Layout of a decoded packet table, see decode(). Fields match ChipData's
+PACKET_DTYPE = np.dtype([
+    ('word',    np.uint64),
+    ('kind',    np.uint8),
+    ('ctrl',    np.uint8),
+    ('bottom',  np.uint8),
+    ('hitmap',  np.uint8),
+    ('corepr',  np.uint8),
+    ('col',     np.uint8),
+    ('sec',     np.uint8),
+    ('ts',      np.uint8),
+    ('ts_fpga', np.uint32),
+    ('ser',     np.uint8),
+    ('ts_sw',   np.uint32),
+    ('ts_ext',  np.int64)
+])
+
+# Hitmap bit -> pixel offsets within the PR, and set bits for each hitmap value
+PIX_ROW_OFFSET = (0, 0, 1, 1, 2, 2, 3, 3)
+PIX_COL_OFFSET = (0, 1, 0, 1, 0, 1, 0, 1)
+HITMAP_PIXELS = tuple(tuple(pix for pix in range(8) if (hitmap >> pix) & 0b1) for hitmap in range(256))
+HITMAP_BITS = np.array([[(hitmap >> pix) & 0b1 for pix in range(8)] for hitmap in range(256)], dtype=bool)
 
 @dataclass
 class FPGAData:
@@ -77,6 +114,18 @@ class FPGAData:
     def from_packets(packets):
         return [FPGAData(x) for x in packets]
 
+class LazyFPGAPacket:
+    """Base of the packets built by materialize_table, which only keep the
+    raw word they were decoded from: their FPGAData is created when
+    fpga_packet is first accessed.
+    """
+    def __getattr__(self, name):
+        if name == 'fpga_packet' and '_word' in self.__dict__:
+            self.fpga_packet = FPGAData(self.__dict__.pop('_word'))
+            return self.fpga_packet
+
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
 @dataclass
 class Pixel:
     """Represents a Pixel in the Matrix
@@ -186,7 +235,7 @@ class Pixel:
         return (row & 0x1)*2 + (col & 0x1)
 
 @dataclass
-class ChipData:
+class ChipData(LazyFPGAPacket):
     """Represents a Data Packet received from the FPGA
 
     :param FPGAData fpga_packet: Data packet received from the FPGA
@@ -249,7 +298,8 @@ class ChipData:
         if self.ts > ts_fpga_lsb:
             ts_fpga_msb = (ts_fpga_msb-0x100)
 
-        self.ts_ext = (self.ts_sw << 24) | ts_fpga_msb | self.ts
+        # The borrow, if any, is taken from the software timestamp
+        self.ts_ext = (self.ts_sw << 24) + ts_fpga_msb + self.ts
 
     def get_pixels(self):
         """Produces a list of Pixels contained in the data packet
@@ -259,20 +309,18 @@ class ChipData:
         """
         pixels = []
 
-        for pix in range(8):
-            if (self.hitmap >> pix) & 0b1 == 0:
-                continue
-
-            # External contributions
-            row = self.corepr*4
-            col = self.sec*32 + self.col*2
+        # External contributions
+        row_base = self.corepr*4
+        col_base = self.sec*32 + self.col*2
+        slave_top = self.bottom == 0 and self.corepr < 0x7f
 
+        for pix in HITMAP_PIXELS[self.hitmap]:
             # Hitmap contributions
-            row += math.floor(pix/2)
-            col += (pix % 2)
+            row = row_base + PIX_ROW_OFFSET[pix]
+            col = col_base + PIX_COL_OFFSET[pix]
 
             # If slave, check whether top or bottom
-            if pix < 4 and self.bottom == 0 and self.corepr < 0x7f:
+            if pix < 4 and slave_top:
                 row += 2
 
             pixels.append(Pixel(row, col))
@@ -283,7 +331,7 @@ class ChipData:
         return "%s - SER[%2d] @ [%2d][%3d][%2x] = %s (%1d) @ %d %d %d = %d" % (self.fpga_packet.to_hex(), self.ser, self.sec, self.col, self.corepr, format(self.hitmap, '#010b'), self.bottom, self.ts_sw, self.ts_fpga, self.ts, self.ts_ext)
 
 @dataclass
-class TestPulse:
+class TestPulse(LazyFPGAPacket):
     """A TestPulse data packet from the FPGA
 
     :param FPGAData fpga_packet: 64-bit data from the FPGA
@@ -344,3 +392,297 @@ class CustomWord:
         fpga_hex = 0 if not isinstance(self.fpga_packet, FPGAData) else self.fpga_packet.to_hex()
         payload = self.payload if self.payload is not None else 0
         return "%s -     MSG : 0x%x - PAYLOAD : 0x%x" % (fpga_hex, self.message, payload)
+
+def as_words(packets):
+    """Converts FPGA packets to a flat array of 64-bit words, without copying
+    if they already are one.
+
+    :param packets: Packets as returned by Chip.packets_read or Chip.readout
+    :type packets: numpy.ndarray | list[int] | list[FPGAData]
+    :returns: Raw words
+    :rtype: numpy.ndarray[uint64]
+    """
+    if isinstance(packets, np.ndarray):
+        return packets.astype(np.uint64, copy=False).ravel()
+
+    if len(packets) > 0 and isinstance(packets[0], FPGAData):
+        return np.fromiter((int(x.word) for x in packets), dtype=np.uint64, count=len(packets))
+
+    return np.asarray(packets, dtype=np.uint64).ravel()
+
+def decode(packets):
+    """Decodes a whole array of FPGA packets at once. Every row holds the fields
+    of the corresponding ChipData, regardless of the packet type: use the kind
+    column (KIND_DATA, KIND_TP, KIND_WORD, KIND_OVERFLOW) to tell them apart.
+    The timestamps are extended as if the packets were the beginning of a
+    Sequence, see extend_timestamps().
+
+    :param packets: Packets as returned by Chip.packets_read or Chip.readout
+    :type packets: numpy.ndarray | list[int] | list[FPGAData]
+    :returns: Decoded packets
+    :rtype: numpy.ndarray[PACKET_DTYPE]
+    """
+    words = as_words(packets)
+    table = np.empty(len(words), dtype=PACKET_DTYPE)
+
+    table['word']    = words
+    table['ctrl']    = words >> 60
+    table['bottom']  = words & 0x1
+    table['hitmap']  = (words >> 1) & 0xff
+    table['corepr']  = (words >> 9) & 0x7f
+    table['col']     = (words >> 16) & 0xf
+    table['sec']     = (words >> 20) & 0xf
+    table['ts']      = (words >> 24) & 0xff
+    table['ts_fpga'] = (words >> 32) & 0xffffff
+    table['ser']     = (words >> 56) & 0xf
+    table['ts_sw']   = 0
+
+    ctrl = table['ctrl']
+    table['kind'] = KIND_DATA
+    table['kind'][ctrl == 0xa] = KIND_TP
+    table['kind'][ctrl == 0xc] = KIND_WORD
+    table['kind'][ctrl == 0xf] = KIND_OVERFLOW
+
+    extend_timestamps(table)
+
+    return table
+
+def extend_timestamps(table, ts_sw=0):
+    """Extends the timestamps of a whole decoded table in one pass. The
+    software timestamp of each packet is ts_sw plus the number of Timestamp
+    Overflow packets preceding it, so that consecutive chunks of a stream
+    only need to be seeded with the count returned for the previous one.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded packets, updated in place
+    :param int ts_sw: Software timestamp at the beginning of the table
+    :returns: Software timestamp at the end of the table
+    :rtype: int
+    """
+    overflows = np.cumsum(table['kind'] == KIND_OVERFLOW)
+    table['ts_sw'] = ts_sw + overflows
+    ts_base = table['ts_sw'].astype(np.int64) << 24
+
+    # Chip data: see ChipData.extend_timestamp
+    ts_fpga = table['ts_fpga'].astype(np.int64)
+    ts = table['ts'].astype(np.int64)
+    ts_fpga_msb = ts_fpga & 0xffff00
+    ts_fpga_msb[ts > ((ts_fpga+1) & 0xff)] -= 0x100
+
+    table['ts_ext'] = np.where(table['kind'] == KIND_DATA, ts_base + ts_fpga_msb + ts, 0)
+
+    # Test pulses: see TestPulse.extend_timestamp
+    tps = table['kind'] == KIND_TP
+    table['ts_ext'][tps] = ts_base[tps] | (table['word'][tps] & 0xffffff).astype(np.int64)
+
+    return ts_sw + (int(overflows[-1]) if len(overflows) > 0 else 0)
+
+def rebase_timestamps(table, ts_sw):
+    """Offsets the software timestamp of a decoded table, as if it had been
+    extended starting from ts_sw instead of 0.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded packets, updated in place
+    :param int ts_sw: Timestamp overflows to add
+    """
+    if ts_sw == 0:
+        return
+
+    table['ts_sw'] += ts_sw
+    table['ts_ext'][table['kind'] != KIND_WORD] += ts_sw << 24
+
+def materialize(row):
+    """Builds the packet object corresponding to a row of a decoded table
+
+    :param row: Row of a decoded packet table
+    :type row: numpy.void[PACKET_DTYPE]
+    :returns: Data Packet of the corresponding type
+    :rtype: ChipData | TestPulse | CustomWord
+    """
+    fpga_packet = FPGAData(int(row['word']))
+
+    if row['kind'] == KIND_WORD:
+        return CustomWord(fpga_packet)
+
+    if row['kind'] == KIND_TP:
+        packet = TestPulse(fpga_packet)
+    else:
+        packet = ChipData(fpga_packet)
+
+    packet.ts_sw = int(row['ts_sw'])
+    packet.extend_timestamp()
+
+    return packet
+
+def expand_pixels(table):
+    """Expands decoded data packets into the pixels they contain. Equivalent
+    to calling ChipData.get_pixels on every packet, in the same order.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded data packets
+    :returns: Pixel rows, pixel columns and index of the originating packet
+    :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    packet_idx, pix = np.nonzero(HITMAP_BITS[table['hitmap']])
+
+    corepr = table['corepr'][packet_idx].astype(np.int32)
+    row = corepr*4 + np.take(PIX_ROW_OFFSET, pix)
+    col = table['sec'][packet_idx].astype(np.int32)*32 + table['col'][packet_idx].astype(np.int32)*2 + np.take(PIX_COL_OFFSET, pix)
+
+    # If slave, check whether top or bottom
+    slave_top = (pix < 4) & (table['bottom'][packet_idx] == 0) & (corepr < 0x7f)
+    row += 2*slave_top
+
+    return (row, col, packet_idx)
+
+def hit_counts(table, counts=None):
+    """Accumulates the pixels hit by decoded data packets in a matrix
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded data packets
+    :param numpy.ndarray counts: Optional, 512x512 matrix to accumulate into
+    :returns: Hits per pixel, indexed by [row][col]
+    :rtype: numpy.ndarray
+    """
+    if counts is None:
+        counts = np.zeros((512, 512), dtype=np.int32)
+
+    row, col, _ = expand_pixels(table)
+    np.add.at(counts, (row, col), 1)
+
+    return counts
+
+def squash_masters(table):
+    """Groups decoded data packets by the Master that produced them, and
+    merges their hitmaps. Smart Readout packets are left out.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded data packets
+    :returns: Index in table of the first packet from each Master, by
+        descending Master index, and the corresponding merged hitmaps
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    """
+    idx = np.flatnonzero((table['bottom'] == 1) | ((table['hitmap'] & 0xf) == 0))
+    if len(idx) == 0:
+        return (idx, np.empty(0, dtype=np.uint8))
+
+    # See ChipData.master_idx
+    master = (table['sec'][idx].astype(np.int32)*16 + table['col'][idx])*128 + table['corepr'][idx]
+    order = np.argsort(-master, kind='stable')
+    idx = idx[order]
+    master = master[order]
+
+    starts = np.flatnonzero(np.r_[True, master[1:] != master[:-1]])
+    hitmaps = np.bitwise_or.reduceat(table['hitmap'][idx], starts)
+
+    return (idx[starts], hitmaps)
+
+def squash(table):
+    """Merges decoded data packets from the same Master by OR-ing their
+    hitmaps. Smart Readout packets are left out.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded data packets
+    :returns: The first packet from each Master, holding the merged hitmap,
+        by descending Master index
+    :rtype: numpy.ndarray[PACKET_DTYPE]
+    """
+    first, hitmaps = squash_masters(table)
+
+    squashed = table[first]
+    squashed['hitmap'] = hitmaps
+    squashed['bottom'] = 1
+    squashed['word'] = (squashed['word'] & ~np.uint64(0x1ff)) | (hitmaps.astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+
+    return squashed
+
+def tag_injections(ts_ext, ser, tps, ts_delta, fe_ntol=4, fe_ptol=4, tp_ntol=4, tp_ptol=1):
+    """Tags data packets according to the Test Pulses that injected them.
+    A packet received shortly after a Test Pulse is its rising edge. A packet
+    received ts_delta after a rising edge packet from the same lane is the
+    falling edge of the same Test Pulse, coupling with the injection circuitry.
+
+    :param numpy.ndarray ts_ext: Extended timestamps of the data packets, in the order they were received
+    :param numpy.ndarray ser: Lanes of the data packets
+    :param numpy.ndarray tps: Extended timestamps of the Test Pulses, sorted
+    :param int ts_delta: Test Pulse duration, in timestamp counts
+    :param int fe_ntol: Falling edge tolerance before the expected timestamp
+    :param int fe_ptol: Falling edge tolerance after the expected timestamp
+    :param int tp_ntol: Rising edge tolerance before the expected timestamp
+    :param int tp_ptol: Rising edge tolerance after the expected timestamp
+    :returns: Tag of each packet: TAG_ISOLATED, TAG_RISING_EDGE, TAG_FALLING_EDGE or TAG_AMBIGUOUS
+    :rtype: numpy.ndarray[uint8]
+    """
+    ts_ext = np.asarray(ts_ext, dtype=np.int64)
+    ser = np.asarray(ser, dtype=np.uint8)
+    tps = np.asarray(tps, dtype=np.int64)
+
+    # Rising edges: first Test Pulse not before the tolerance window
+    idx = np.searchsorted(tps, ts_ext - 5 - tp_ntol)
+    found_tp = idx < len(tps)
+    found_tp[found_tp] = tps[idx[found_tp]] <= ts_ext[found_tp] - 5 + tp_ptol
+
+    # Falling edges: rising edges previously received from the same lane
+    found_fe = np.zeros(len(ts_ext), dtype=bool)
+    order = np.argsort(ser, kind='stable')
+    for lane in np.split(order, np.flatnonzero(np.diff(ser[order])) + 1):
+        lane_ts = ts_ext[lane]
+        lane_tp = found_tp[lane]
+        edges = lane_ts[lane_tp]
+        if len(edges) == 0:
+            continue
+
+        if np.all(edges[1:] >= edges[:-1]):
+            # Rising edges received before each packet
+            received = np.cumsum(lane_tp) - lane_tp
+            idx = np.searchsorted(edges, lane_ts - ts_delta - fe_ntol)
+            found = idx < received
+            found[found] = edges[idx[found]] <= lane_ts[found] - ts_delta + fe_ptol
+        else:
+            # Out of order rising edges: replay the lane one packet at a time
+            found = np.zeros(len(lane), dtype=bool)
+            parsed = []
+            for i, (ts, tp) in enumerate(zip(lane_ts.tolist(), lane_tp.tolist())):
+                j = bisect.bisect_left(parsed, ts - ts_delta - fe_ntol)
+                found[i] = j != len(parsed) and parsed[j] <= ts - ts_delta + fe_ptol
+                if tp:
+                    parsed.append(ts)
+
+        found_fe[lane] = found
+
+    return (found_tp*TAG_RISING_EDGE | found_fe*TAG_FALLING_EDGE).astype(np.uint8)
+
+def materialize_table(table, sequence=None):
+    """Builds the packet objects of a whole decoded table, equivalent to
+    elaborating its packets one by one with FPGAData.elaborate. Timestamp
+    overflow rows are skipped. The fields are taken from the table columns,
+    instead of being decoded again for each packet.
+
+    :param numpy.ndarray[PACKET_DTYPE] table: Decoded packets
+    :param Sequence sequence: Optional, sequence the packets belong to
+    :returns: Data Packets
+    :rtype: list[ChipData | TestPulse | CustomWord]
+    """
+    new = object.__new__
+    packets = []
+    append = packets.append
+
+    # Data and Test Pulse packets keep their raw word, instead of an
+    # FPGAData each (see LazyFPGAPacket)
+    columns = [table[x].tolist() for x in ('kind', 'word', 'bottom', 'hitmap', 'corepr', 'col', 'sec', 'ts', 'ts_fpga', 'ser', 'ts_sw', 'ts_ext')]
+    for kind, word, bottom, hitmap, corepr, col, sec, ts, ts_fpga, ser, ts_sw, ts_ext in zip(*columns):
+        if kind == KIND_OVERFLOW:
+            continue
+
+        if kind == KIND_DATA:
+            packet = new(ChipData)
+            packet.__dict__ = {
+                '_word': word, 'sequence': sequence, 'ts_sw': ts_sw, 'tag': None,
+                'bottom': bottom, 'hitmap': hitmap, 'corepr': corepr, 'col': col, 'sec': sec,
+                'ts': ts, 'ts_fpga': ts_fpga, 'ser': ser, 'falling': False, 'ts_ext': ts_ext
+            }
+        elif kind == KIND_TP:
+            packet = new(TestPulse)
+            packet.__dict__ = {'_word': word, 'sequence': sequence, 'ts_sw': ts_sw, 'ts': word & 0xffffff, 'ts_ext': ts_ext}
+        else:
+            packet = CustomWord(FPGAData(word))
+
+        append(packet)
+
+    FPGAData.packets_count += int(np.count_nonzero(table['kind'] == KIND_DATA))
+
+    return packets
@@ -0,0 +1,650 @@
+##
+# @file emulator.py
+#
+# @brief Software stand-in for the arcadia_daq C++ module
+#
+# @section description_emulator Description
+# Implements the FPGAIf/ChipIf interface exported by the pybind module in
+# pure Python, so that pyarcadia can run, be benchmarked and be debugged
+# without a DAQ board. It models the readout FIFO, the controller commands,
+# the chip configuration registers, test pulses, custom words, FPGA
+# timestamp overflows and random pixel hits.
+#
+# Select it by setting the PYARCADIA_EMULATOR environment variable before
+# importing pyarcadia.
+#
+# @section todo_emulator TODO
+# - Model smart readout and the readout latency of the chip.
+
+import math
+import time
+import threading
+import numpy as np
+
+from .gcr import GCR_MAP, GCR_ADDRESSES
+
+CLOCK_HZ = 80E6
+
+ARCADIA_WR_PNTR = 0x0
+ARCADIA_WR_DATA = 0x1
+ARCADIA_WR_STAT = 0x2
+ARCADIA_WR_ICR0 = 0x3
+ARCADIA_WR_ICR1 = 0x4
+ARCADIA_RD_PNTR = 0x8
+ARCADIA_RD_DATA = 0x9
+ARCADIA_RD_STAT = 0xa
+ARCADIA_RD_ICR0 = 0xb
+ARCADIA_RD_ICR1 = 0xc
+
+# Name: (word address, mask, offset, default value), as in DAQBoard_comm.h
+CTRL_CMD_MAP = {
+    'resetIDELAYTCTRL':     (0x01, 0x0001,  0, 0),
+    'resetISERDES':         (0x02, 0x0001,  0, 0),
+    'setSyncResetPhase':    (0x07, 0x0001,  0, 0),
+    'doRESET':              (0x08, 0x0001,  0, 0),
+    'resetSPI':             (0x09, 0x0001,  0, 0),
+    'resetCounters':        (0x10, 0x0001,  0, 0),
+    'syncTX':               (0x11, 0xffff,  0, 0),
+    'readTxState':          (0x12, 0xffff,  0, 0),
+    'read8b10bErrCounters': (0x13, 0x000f,  0, 0),
+    'writeTimeStampPeriod': (0x14, 0xffff,  0, 0),
+    'resetTimeStampCounter':(0x15, 0xffff,  0, 0),
+    'setTxDataEnable':      (0x20, 0xffff,  0, 0),
+    'loadUserData_0':       (0x21, 0xffff,  0, 0),
+    'loadUserData_1':       (0x22, 0xffff,  0, 0),
+    'loadUserData_2':       (0x23, 0xffff,  0, 0),
+    'loadUserData_3':       (0x24, 0xffff,  0, 0),
+    'loadUserDataPush':     (0x25, 0x0001,  0, 0),
+    'loadTPOnTime':         (0x26, 0xfffff, 0, 0),
+    'loadTPOffTime':        (0x27, 0xfffff, 0, 0),
+    'loadTPNumber':         (0x28, 0xfffff, 0, 0),
+    'runTPSequence':        (0x29, 0x0001,  0, 0),
+    'loadTSDeltaLSB':       (0x2a, 0xfffff, 0, 0),
+    'loadTSDeltaMSB':       (0x2b, 0xfffff, 0, 0),
+}
+
+for _tap in range(16):
+    CTRL_CMD_MAP['setIDELAYTap%x' % _tap] = (0x03 + _tap//4, 0x001f, 5*(_tap % 4), 0)
+
+CTRL_ADDRESSES = max(x[0] for x in CTRL_CMD_MAP.values()) + 1
+
+FIFO_PACKETS = 32768
+
+# As FifoStats in DAQBoard_comm.h
+STATS_COUNTERS = ['loop_iterations', 'empty_polls', 'blocks_read', 'packets_read',
+    'bytes_read', 'short_reads', 'max_occupancy', 'max_packets_stalls',
+    'ring_full_stalls', 'dispatches', 'dispatch_time_us']
+STATS_LATENCY_BUCKETS = 24
+
+def pack_hits(ticks, rows, cols, ts_delta=0):
+    """Packs pixel hits into data words, one per tick and Pixel Region, as
+    sent by the chip and timestamped by the FPGA.
+
+    :param numpy.ndarray ticks: Timestamp tick of each hit
+    :param numpy.ndarray rows: Row of each hit
+    :param numpy.ndarray cols: Column of each hit
+    :param int ts_delta: Offset of the FPGA timestamp w.r.t. the chip's
+
+    :returns: Timestamp tick and data word of each packet, in readout order
+    :rtype: tuple of numpy.ndarray
+    """
+    ticks = np.asarray(ticks, dtype=np.int64)
+    if len(ticks) == 0:
+        return ticks, np.empty(0, dtype=np.uint64)
+
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    sec = cols >> 5
+    dcol = (cols >> 1) & 0xf
+    corepr = rows >> 2
+    pix = (rows & 0x3)*2 + (cols & 0x1)
+
+    # Group hits by tick and Pixel Region
+    key = ((ticks*16 + sec)*16 + dcol)*128 + corepr
+    order = np.argsort(key, kind='stable')
+    key, pix = key[order], pix[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    hitmap = np.bitwise_or.reduceat(np.left_shift(1, pix).astype(np.uint64), starts)
+
+    key = key[starts]
+    corepr = (key & 0x7f).astype(np.uint64)
+    dcol = ((key >> 7) & 0xf).astype(np.uint64)
+    sec = ((key >> 11) & 0xf).astype(np.uint64)
+    tick = key >> 15
+
+    ts = (tick & 0xff).astype(np.uint64)
+    ts_fpga = ((tick - ts_delta) & 0xffffff).astype(np.uint64)
+    words = np.uint64(1) | (hitmap << np.uint64(1)) | (corepr << np.uint64(9)) | \
+        (dcol << np.uint64(16)) | (sec << np.uint64(20)) | (ts << np.uint64(24)) | \
+        (ts_fpga << np.uint64(32)) | (sec << np.uint64(56))
+
+    return tick, words
+
+def set_ipbus_loglevel(level):
+    """Compatibility stub, there is no IPbus traffic to log"""
+    return
+
+class ChipIf:
+    """Emulated chip and its FPGA readout channel
+
+    :param int chip_id: Chip id [0,1,2]
+    :param FPGAIf fpga: Emulated FPGA the chip is attached to
+
+    :ivar float hit_rate: Random pixel hits per second, over the unmasked pixels
+    :ivar float falling_edge_probability: Probability of a spurious hit on the
+        Test Pulse falling edge, for analog injections
+    :ivar int latency: Timestamp ticks between an injection and its data
+    """
+    hit_rate = 0
+    falling_edge_probability = 0
+    latency = 5
+
+    def __init__(self, chip_id, fpga):
+        self.chip_id = chip_id
+        self.fpga = fpga
+
+        self.max_packets = int(12.5E6)
+        self.timeout = 0
+        self.idle_timeout = 0
+        self.ring_size = 0
+        self.pipelined_read = False
+        self.spi_poll_reads = 4
+        self.gcr_write_changed_only = False
+        self.gcr_writes_suppressed = 0
+        self.packets_recorded = 0
+        self.record_file = None
+
+        self.lock = threading.RLock()
+        self.rng = np.random.default_rng(chip_id)
+
+        # Per-pixel threshold, in VCASN units
+        self.threshold_mu = self.rng.normal(30, 3, (512, 512))
+        self.threshold_sigma = np.abs(self.rng.normal(1.5, 0.3, (512, 512))) + 0.1
+
+        self.spi_transactions = 0
+        self.spi_transaction = False
+        self.spi_pointer = 0
+
+        self.gcr_valid = [False] * GCR_ADDRESSES
+        self.ctrl = [0] * CTRL_ADDRESSES
+
+        self.fifo = []
+        self.fifo_cycles = []
+        self.overflows = 0
+        self.reading = False
+        self.stats_reset()
+
+        self.t0 = time.monotonic()
+        self.busy_until = 0
+        self.generated_until = 0
+        self.last_write = 0
+        self.last_tick = 0
+        self.ts_period = 80
+
+        self._reset_chip()
+        self.gcr_cache = list(self.gcr)
+
+    # Emulated hardware
+    def _reset_chip(self):
+        self.gcr = [0] * GCR_ADDRESSES
+        for param in GCR_MAP.values():
+            self.gcr[param[0]] |= (param[3] & param[1]) << param[2]
+
+        self.pcr = np.zeros((512, 512), dtype=np.uint8)
+
+    def _cache_update(self, addr, value):
+        self.gcr_cache[addr] = value
+        self.gcr_valid[addr] = True
+
+    def _gcrpar(self, gcrpar):
+        addr, mask, offset, _ = GCR_MAP[gcrpar]
+        return (self.gcr[addr] >> offset) & mask
+
+    def _cycles(self):
+        return int((time.monotonic() - self.t0) * CLOCK_HZ)
+
+    def _now(self):
+        return max(self._cycles(), self.busy_until)
+
+    def _ts_delta(self):
+        lsb = CTRL_CMD_MAP['loadTSDeltaLSB']
+        msb = CTRL_CMD_MAP['loadTSDeltaMSB']
+        return (self.ctrl[lsb[0]] & lsb[1]) | ((self.ctrl[msb[0]] & msb[1]) << 20)
+
+    def _lanes(self):
+        return self.ctrl[CTRL_CMD_MAP['setTxDataEnable'][0]] & 0xffff
+
+    def _write_icr0(self, value):
+        # Chip or GCR reset, on pulse or stop
+        if (value >> 3) & 0b11 and value & 0b101:
+            pcr = self.pcr
+            self._reset_chip()
+            if not (value >> 3) & 0b1:
+                self.pcr = pcr
+
+        if not (value >> 8) & 0b1:
+            return
+
+        # PCR programming through the section configuration helpers
+        secs    = self._gcrpar('HELPER_SECCFG_SECTIONS')
+        cols    = self._gcrpar('HELPER_SECCFG_COLUMNS')
+        prstart = self._gcrpar('HELPER_SECCFG_PRSTART')
+        prstop  = self._gcrpar('HELPER_SECCFG_PRSTOP')
+        prskip  = self._gcrpar('HELPER_SECCFG_PRSKIP')
+        pixsel  = self._gcrpar('HELPER_SECCFG_PIXELSELECT')
+        cfgval  = self._gcrpar('HELPER_SECCFG_CFGDATA')
+
+        regions = np.arange(prstart, prstop+1, prskip+1)
+        dcols = np.array([sec*32 + col*2 for sec in range(16) if (secs >> sec) & 0b1 for col in range(16) if (cols >> col) & 0b1], dtype=int)
+        if len(regions) == 0 or len(dcols) == 0:
+            return
+
+        for pix in range(4):
+            if ((pixsel >> pix) & 0b1) == 0:
+                continue
+
+            rows = regions*4 + ((pixsel >> 4) & 0b1)*2 + pix//2
+            self.pcr[np.ix_(rows, dcols + pix % 2)] = cfgval
+
+    def _section_mask(self, gcr):
+        return np.array([(self.gcr[gcr] >> sec) & 0b1 for sec in range(16)], dtype=bool).repeat(32)
+
+    def _readable(self):
+        """Pixels whose hits reach the FPGA FIFO"""
+        col_ok = ~self._section_mask(2) & ~self._section_mask(3)
+        col_ok &= np.array([(self._lanes() >> sec) & 0b1 for sec in range(16)], dtype=bool).repeat(32)
+
+        masked = ((self.pcr >> 1) & 0b1).astype(bool) & ~self._section_mask(6)[np.newaxis, :]
+        return ~masked & col_ok[np.newaxis, :]
+
+    def _injected(self):
+        inject = (self.pcr & 0b1).astype(bool) | self._section_mask(5)[np.newaxis, :]
+        return inject & self._readable()
+
+    # FIFO
+    def _push(self, cycles, words):
+        """Pushes time-ordered words in the FIFO, inserting the FPGA timestamp
+        overflows that happened in between.
+
+        :param numpy.ndarray cycles: Reception time of each word, in clock cycles
+        :param numpy.ndarray words: Words to push
+        """
+        if len(words) == 0:
+            return
+
+        cycles = np.asarray(cycles, dtype=np.int64)
+        wraps = (cycles // self.ts_period) >> 24
+        last_wrap = self.last_tick >> 24
+        self.last_tick = int(cycles[-1] // self.ts_period)
+
+        # One overflow word per wrap, even when no data came in between
+        new_wraps = np.unique(wraps[wraps > last_wrap])
+        if len(new_wraps) > 0:
+            at = np.searchsorted(wraps, new_wraps).repeat(np.diff(np.r_[last_wrap, new_wraps]))
+            words = np.insert(words, at, np.uint64(0xf << 60))
+            cycles = np.insert(cycles, at, cycles[at])
+
+        capacity = self.max_packets if self.reading else FIFO_PACKETS
+        room = max(0, capacity - len(self.fifo))
+        if len(words) > room:
+            self.overflows += len(words) - room
+            words, cycles = words[:room], cycles[:room]
+
+        self.fifo.extend(words.tolist())
+        self.fifo_cycles.extend(cycles.tolist())
+        self.last_write = max(self.last_write, int(cycles[-1]) if len(cycles) else 0)
+
+    def _data_words(self, ticks, rows, cols):
+        ticks, words = pack_hits(ticks, rows, cols, self._ts_delta())
+        return ticks*self.ts_period, words
+
+    def _generate(self):
+        """Generates the random hits up to the current time"""
+        now = self._now()
+        start = max(self.generated_until, now - int(CLOCK_HZ))
+        self.generated_until = now
+
+        if self.hit_rate <= 0 or now <= start:
+            return
+
+        hits = self.rng.poisson(self.hit_rate * (now - start)/CLOCK_HZ)
+        pixels = np.flatnonzero(self._readable())
+        if hits == 0 or len(pixels) == 0:
+            return
+
+        ticks = np.sort(self.rng.integers(start, now, hits)) // self.ts_period
+        chosen = self.rng.choice(pixels, hits)
+        self._push(*self._data_words(ticks, chosen >> 9, chosen & 0x1ff))
+
+    # SPI
+    def spi_transfer(self, command, payload):
+        with self.lock:
+            self.spi_transactions += 1
+            command = int(command)
+
+            if command == ARCADIA_WR_PNTR:
+                self.spi_pointer = payload & 0x1fff
+            elif command == ARCADIA_WR_DATA:
+                self.gcr[self.spi_pointer] = payload & 0xffff
+            elif command == ARCADIA_WR_ICR0:
+                self._write_icr0(payload)
+            elif command == ARCADIA_RD_DATA:
+                return (0, self.gcr[self.spi_pointer])
+
+            return (0, 0)
+
+    def spi_transaction_begin(self):
+        self.spi_transaction = True
+
+    def spi_transaction_end(self):
+        self.spi_transaction = False
+        return 0
+
+    # Chip Configuration
+    def dump_gcrs(self, force_update):
+        return {gcrpar: self.read_gcrpar(gcrpar, force_update)[1] for gcrpar in sorted(GCR_MAP)}
+
+    def read_gcr(self, addr, force_update):
+        if force_update:
+            self.spi_transfer(ARCADIA_WR_PNTR, addr | 0x2000)
+            _, value = self.spi_transfer(ARCADIA_RD_DATA, 0)
+            self._cache_update(addr, value)
+
+        return (0, self.gcr_cache[addr])
+
+    def write_gcr(self, addr, data, force=False):
+        if addr >= GCR_ADDRESSES:
+            return -1
+
+        if self.gcr_write_changed_only and not force and self.gcr_valid[addr] and self.gcr_cache[addr] == data:
+            self.gcr_writes_suppressed += 1
+            return 0
+
+        self.spi_transfer(ARCADIA_WR_PNTR, addr | 0x2000)
+        self.spi_transfer(ARCADIA_WR_DATA, data)
+        self._cache_update(addr, data)
+
+        return 0
+
+    def write_gcrpar(self, gcrpar, value, force=False):
+        if gcrpar not in GCR_MAP:
+            return -1
+
+        addr, mask, offset, _ = GCR_MAP[gcrpar]
+        data = (self.gcr_cache[addr] & ~(mask << offset)) | ((value & mask) << offset)
+        return self.write_gcr(addr, data, force)
+
+    def read_gcrpar(self, gcrpar, force_update):
+        if gcrpar not in GCR_MAP:
+            return (-1, 0)
+
+        addr, mask, offset, _ = GCR_MAP[gcrpar]
+        ret, value = self.read_gcr(addr, force_update)
+        return (ret, (value >> offset) & mask)
+
+    def reinitialize_gcr(self, addr):
+        value = 0
+        for param in GCR_MAP.values():
+            if param[0] == addr:
+                value |= (param[3] & param[1]) << param[2]
+
+        return self.write_gcr(addr, value, True)
+
+    def invalidate_gcr_cache(self):
+        self.gcr_valid = [False] * GCR_ADDRESSES
+
+    def write_icr(self, icr_reg, value):
+        if icr_reg == 'ICR0':
+            return self.spi_transfer(ARCADIA_WR_ICR0, value)[0]
+
+        if icr_reg == 'ICR1':
+            return self.spi_transfer(ARCADIA_WR_ICR1, value)[0]
+
+        return -1
+
+    def check_gcr_consistency(self):
+        errors = 0
+        for addr in range(GCR_ADDRESSES):
+            cached = self.gcr_cache[addr]
+            if self.read_gcr(addr, True)[1] != cached:
+                errors += 1
+
+        return errors
+
+    # Controller
+    def send_controller_command(self, cmd, arg):
+        if cmd not in CTRL_CMD_MAP:
+            return (-1, 0)
+
+        with self.lock:
+            addr, mask, offset, _ = CTRL_CMD_MAP[cmd]
+            self.ctrl[addr] &= ~(mask << offset)
+            self.ctrl[addr] |= (arg & mask) << offset
+
+            resp = (addr << 20) | self.ctrl[addr]
+
+            if cmd == 'readTxState':
+                resp = 0xffff
+            elif cmd == 'read8b10bErrCounters':
+                resp = 0
+            elif cmd == 'writeTimeStampPeriod':
+                self.ts_period = (arg & mask) + 1
+            elif cmd == 'doRESET':
+                self._reset_chip()
+            elif cmd == 'loadUserDataPush':
+                self._push_custom_word()
+            elif cmd == 'runTPSequence':
+                self._run_tp_sequence()
+
+            return (0, resp)
+
+    def _push_custom_word(self):
+        self._generate()
+
+        word = 0
+        for i in range(4):
+            word |= (self.ctrl[CTRL_CMD_MAP['loadUserData_%d' % i][0]] & 0xffff) << (16*i)
+
+        now = self._now()
+        self.busy_until = now
+        self._push([now], np.array([word], dtype=np.uint64))
+
+    def _run_tp_sequence(self):
+        self._generate()
+
+        t_on = (self.ctrl[CTRL_CMD_MAP['loadTPOnTime'][0]] & 0xfffff) + 2
+        t_off = (self.ctrl[CTRL_CMD_MAP['loadTPOffTime'][0]] & 0xfffff) + 1
+        pulses = self.ctrl[CTRL_CMD_MAP['loadTPNumber'][0]] & 0xfffff
+        if pulses == 0:
+            return
+
+        start = self._now() + self.ts_period
+        cycles = start + np.arange(pulses, dtype=np.int64)*(t_on + t_off)
+        ticks = cycles // self.ts_period
+        self.busy_until = int(cycles[-1] + t_on + t_off + (self.latency + 2)*self.ts_period)
+        self.generated_until = self.busy_until
+
+        tps = (np.uint64(0xa) << np.uint64(60)) | ((ticks - self._ts_delta()) & 0xffffff).astype(np.uint64)
+
+        # Digital injection always hits, analog follows the pixel's s-curve
+        rows, cols = np.nonzero(self._injected())
+        digital = np.array([(self.gcr[4] >> sec) & 0b1 for sec in range(16)], dtype=bool)[cols >> 5]
+        vcasn = np.array([self._gcrpar('BIAS%d_VCASN' % sec) for sec in range(16)])[cols >> 5]
+        erf = np.frompyfunc(math.erf, 1, 1)
+        z = (vcasn - self.threshold_mu[rows, cols])/(self.threshold_sigma[rows, cols]*math.sqrt(2))
+        p = np.where(digital, 1.0, 0.5*(1 + erf(z).astype(float)))
+        p_fe = np.where(digital, 0.0, self.falling_edge_probability*p)
+
+        hit_ticks, hit_rows, hit_cols = [], [], []
+        for tick in ticks:
+            for edge, probability in ((self.latency, p), (self.latency + t_on//self.ts_period, p_fe)):
+                hit = self.rng.random(len(rows)) < probability
+                hit_ticks.append(np.full(np.count_nonzero(hit), tick + edge))
+                hit_rows.append(rows[hit])
+                hit_cols.append(cols[hit])
+
+        data_cycles, data = self._data_words(np.concatenate(hit_ticks), np.concatenate(hit_rows), np.concatenate(hit_cols))
+        cycles = np.concatenate([cycles, data_cycles])
+        order = np.argsort(cycles, kind='stable')
+        self._push(cycles[order], np.concatenate([tps, data])[order])
+
+    def send_pulse(self, t_on, t_off, tp_number):
+        self.send_controller_command('loadTPOnTime', t_on)
+        self.send_controller_command('loadTPOffTime', t_off)
+        self.send_controller_command('loadTPNumber', tp_number)
+        self.send_controller_command('runTPSequence', 0)
+        return 0
+
+    def calibrate_deserializers(self, verbose=False):
+        return self._lanes() | 0xffff
+
+    # Packets
+    def packets_count(self):
+        with self.lock:
+            self._generate()
+            count = int(np.searchsorted(self.fifo_cycles, self._cycles(), side='right'))
+            self._stats['max_occupancy'] = max(self._stats['max_occupancy'], count)
+            return count
+
+    def packets_reset(self):
+        with self.lock:
+            self._generate()
+            self.fifo = []
+            self.fifo_cycles = []
+
+    def packets_read_start(self):
+        with self.lock:
+            if self.reading:
+                return
+
+            self.packets_reset()
+            self.reading = True
+
+    def packets_read_stop(self):
+        self.reading = False
+
+    def packets_read_active(self):
+        return self.reading
+
+    def packets_read(self, num_packets=0):
+        t0 = time.perf_counter()
+
+        with self.lock:
+            self._generate()
+
+            # Packets sent after the current time are not received yet
+            received = int(np.searchsorted(self.fifo_cycles, self._cycles(), side='right'))
+            if not self.reading and num_packets:
+                received = min(received, num_packets)
+
+            packets = np.array(self.fifo[:received], dtype=np.uint64)
+            del self.fifo[:received]
+            del self.fifo_cycles[:received]
+
+            if self.record_file is not None:
+                self.record_file.write(packets.astype('<u8').tobytes())
+                self.packets_recorded += len(packets)
+
+            # Each read stands for an iteration of the C++ reader thread
+            self._stats['loop_iterations'] += 1
+            self._stats['max_occupancy'] = max(self._stats['max_occupancy'], len(packets))
+            if len(packets) == 0:
+                self._stats['empty_polls'] += 1
+            else:
+                self._stats['blocks_read'] += 1
+                self._stats['packets_read'] += len(packets)
+                self._stats['bytes_read'] += 8*len(packets)
+
+            self._record_dispatch(int((time.perf_counter() - t0)*1E6))
+
+            return packets
+
+    # FIFO reader statistics
+    def _record_dispatch(self, latency_us):
+        self._stats['dispatches'] += 1
+        self._stats['dispatch_time_us'] += latency_us
+        self._latency[min(latency_us.bit_length(), STATS_LATENCY_BUCKETS - 1)] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self._stats)
+            stats['dispatch_latency_us'] = list(self._latency)
+            return stats
+
+    def stats_reset(self):
+        with self.lock:
+            self._stats = dict.fromkeys(STATS_COUNTERS, 0)
+            self._latency = [0] * STATS_LATENCY_BUCKETS
+
+    # Raw packets recording
+    def record_start(self, path, ts_resolution=0):
+        from .recording import write_header
+
+        with self.lock:
+            self.record_stop()
+
+            try:
+                self.record_file = open(path, 'wb')
+            except OSError:
+                return -1
+
+            write_header(self.record_file, self.chip_id, self.gcr_cache, ts_resolution)
+            self.packets_recorded = 0
+
+        return 0
+
+    def record_stop(self):
+        with self.lock:
+            if self.record_file is not None:
+                self.record_file.close()
+                self.record_file = None
+
+    def recording(self):
+        return self.record_file is not None
+
+    def fifo_overflow_count(self):
+        return self.overflows
+
+    def fifo_idle_count(self):
+        with self.lock:
+            self._generate()
+            return max(0, self._cycles() - max(self.last_write, self.busy_until)) // 4
+
+    def fifo_overflow_counter_reset(self):
+        self.overflows = 0
+
+class FPGAIf:
+    """Emulated DAQ board, with three emulated chips
+
+    :param string connection_xml_path: Ignored
+    :param string device_id: Ignored
+    :param bool verbose: Ignored
+    """
+
+    def __init__(self, connection_xml_path, device_id, verbose=False):
+        self.chips = tuple(ChipIf(chip_id, self) for chip_id in range(3))
+        self.registers = {}
+
+    def get_chip(self, chip_id):
+        if chip_id > 2:
+            raise RuntimeError("Invalid chip id: %d" % chip_id)
+
+        return self.chips[chip_id]
+
+    def connect(self):
+        return 0
+
+    def read_conf(self, fname):
+        return 0
+
+    def read_register(self, reg_handler):
+        return (0, self.registers.get(reg_handler, 0))
+
+    def write_register(self, reg_handler, data):
+        self.registers[reg_handler] = data
+        return 0
+
+    def dump_DAQBoard_reg(self):
+        for reg, value in sorted(self.registers.items()):
+            print("%s: 0x%x" % (reg, value))
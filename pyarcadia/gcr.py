@@ -0,0 +1,65 @@
+##
+# @file gcr.py
+#
+# @brief Layout of the ARCADIA Global Configuration Registers
+#
+# @section description_gcr Description
+# Maps each GCR parameter to its word address, mask, offset and default
+# value, as GCR_map in DAQBoard_comm.h does for the C++ module. Used by the
+# emulator, and to decode the GCRs stored in recordings.
+
+# Name: (word address, mask, offset, default value), as in DAQBoard_comm.h
+GCR_MAP = {
+    'READOUT_CLK_DIVIDER':       (0, 0x000f,  0, 3),
+    'TIMING_CLK_DIVIDER':        (0, 0x000f,  4, 8),
+    'MAX_READS':                 (0, 0x000f,  8, 8),
+    'TOKEN_COUNTER':             (0, 0x000f, 12, 8),
+
+    'TEST_PULSE_MASK':           (1, 0xffff, 0, 0),
+    'SECTION_READ_MASK':         (2, 0xffff, 0, 0),
+    'SECTION_CLOCK_MASK':        (3, 0xffff, 0, 0),
+
+    'DIGITAL_INJECTION':         (4, 0xffff, 0, 0),
+    'FORCE_ENABLE_INJECTION':    (5, 0xffff, 0, 0xffff),
+    'FORCE_DISABLE_MASK':        (6, 0xffff, 0, 0xffff),
+
+    'OPERATION':                 (7, 0x0001, 0, 0),
+    'SERIALIZER_SYNC':           (7, 0x0001, 1, 0),
+    'LVDS_STRENGTH':             (7, 0x0007, 2, 4),
+    'SECTION_CLOCK_GATING':      (7, 0x0001, 5, 0),
+    'TIMESTAMP_LATCHES':         (7, 0x0001, 6, 1),
+    'DISABLE_SMART_READOUT':     (7, 0x0001, 7, 0),
+    'EOS_CLOCK_GATING_ENABLE':   (7, 0x0001, 8, 0),
+
+    'HELPER_SECCFG_SECTIONS':    ( 8, 0xffff,  0, 0xffff),
+    'HELPER_SECCFG_COLUMNS':     ( 9, 0xffff,  0, 0xffff),
+    'HELPER_SECCFG_PRSTART':     (10, 0x007f,  0, 0x007f),
+    'HELPER_SECCFG_PRSKIP':      (10, 0x007f,  7, 0x0000),
+    'HELPER_SECCFG_CFGDATA':     (10, 0x0003, 14, 0x0001),
+    'HELPER_SECCFG_PRSTOP':      (11, 0x007f,  0, 0x0000),
+    'HELPER_SECCFG_PIXELSELECT': (11, 0x001f,  7, 0x001f),
+}
+
+for _sec in range(16):
+    _addr = 12 + _sec*3
+    GCR_MAP.update({
+        'BIAS%d_VCAL_LO' % _sec:    (_addr,   0x0001,  0,  0),
+        'BIAS%d_VCAL_HI' % _sec:    (_addr,   0x000f,  1, 15),
+        'BIAS%d_VCASD' % _sec:      (_addr,   0x0007,  5,  4),
+        'BIAS%d_VCASP' % _sec:      (_addr,   0x000f,  8,  4),
+        'BIAS%d_ISF_VINREF' % _sec: (_addr,   0x0007, 12,  7),
+        'BIAS%d_IOTA' % _sec:       (_addr,   0x0001, 15,  0),
+        'BIAS%d_VCASN' % _sec:      (_addr+1, 0x003f,  0, 33),
+        'BIAS%d_ICLIP' % _sec:      (_addr+1, 0x0003,  6,  1),
+        'BIAS%d_IBIAS' % _sec:      (_addr+1, 0x0003,  8,  2),
+        'BIAS%d_VREF_LDO' % _sec:   (_addr+1, 0x0003, 10,  1),
+        'BIAS%d_IFB' % _sec:        (_addr+1, 0x0003, 12,  2),
+        'BIAS%d_ISF' % _sec:        (_addr+1, 0x0003, 14,  2),
+        'BIAS%d_BGR_MEAN' % _sec:   (_addr+2, 0x000f,  0,  7),
+        'BIAS%d_BGR_SLOPE' % _sec:  (_addr+2, 0x000f,  4,  7),
+        'BIAS%d_VINREF' % _sec:     (_addr+2, 0x001f,  8,  7),
+        'BIAS%d_ID' % _sec:         (_addr+2, 0x0003, 13,  1),
+        'BIAS%d_LDO_EN' % _sec:     (_addr+2, 0x0001, 15,  1),
+    })
+
+GCR_ADDRESSES = max(x[0] for x in GCR_MAP.values()) + 1
@@ -0,0 +1,248 @@
+##
+# @file metrics.py
+#
+# @brief Counters and timers of the packet processing pipeline
+#
+# @section description_metrics Description
+# The METRICS registry collects counters, gauges and timers from the hot
+# paths of pyarcadia: packets read and decoded, decoding latency, Sequence
+# queue depth, autoreader idle and blocked time, SPI transactions and FIFO
+# occupancy. Values polled from the hardware, such as the FIFO overflow
+# counter, are registered as samplers and read on each snapshot.
+#
+# The registry is disabled by default, and its recording methods then
+# return right away. Enable it with the PYARCADIA_METRICS environment
+# variable, or at runtime:
+#
+#   from pyarcadia.metrics import METRICS
+#   METRICS.enable()
+#   METRICS.start_logging(period=10)
+#   ...
+#   print(METRICS.snapshot())
+
+import os
+import time
+import logging
+import types
+import weakref
+import threading
+import contextlib
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 't0')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.t0 = None
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.t0)
+
+class Metrics:
+    """Registry of named metrics:
+
+    * counters, accumulated, also reported as rates per second
+    * gauges, reported with their last value and high-water mark
+    * timers, reported with their count, mean and maximum duration
+    * samplers, functions polled on each snapshot, optionally reported with
+      their change since the previous snapshot
+
+    :param bool enabled: Whether metrics are recorded
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+        self._samplers = {}
+        self._logging = None
+        self.reset()
+
+    def enable(self, enabled=True):
+        """Enables, or disables, the recording of metrics
+
+        :param bool enabled: Whether metrics are recorded
+        """
+        self.enabled = enabled
+
+    def reset(self):
+        """Clears the recorded metrics, and restarts the rates"""
+        with self.lock:
+            self._counters = {}
+            self._gauges = {}
+            self._timers = {}
+            self._previous = {}
+            self._t0 = time.monotonic()
+
+    def count(self, name, value=1):
+        """Increments a counter
+
+        :param str name: Counter name
+        :param value: Increment
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """Sets a gauge, tracking its high-water mark
+
+        :param str name: Gauge name
+        :param value: Current value
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            peak = self._gauges[name][1] if name in self._gauges else value
+            self._gauges[name] = (value, max(peak, value))
+
+    def observe(self, name, seconds):
+        """Records a duration in a timer
+
+        :param str name: Timer name
+        :param float seconds: Duration
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            count, total, longest = self._timers.get(name, (0, 0, 0))
+            self._timers[name] = (count + 1, total + seconds, max(longest, seconds))
+
+    def timer(self, name):
+        """Context manager recording the time spent within it in a timer
+
+        :param str name: Timer name
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+
+        return _Timer(self, name)
+
+    def sampler(self, name, function, delta=False):
+        """Registers a function polled on each snapshot. Bound methods are
+        only weakly referenced: the sampler is removed once their object is
+        garbage collected.
+
+        :param str name: Sampler name
+        :param callable function: Returns the sampled value, or a dict of
+            values reported as 'name_key'
+        :param bool delta: Also report the change since the previous snapshot
+        """
+        if isinstance(function, types.MethodType):
+            reference = weakref.WeakMethod(function)
+        else:
+            reference = lambda: function
+
+        with self.lock:
+            self._samplers[name] = (reference, delta)
+
+    def snapshot(self):
+        """Returns the metrics recorded so far, by name. Counters get a
+        '_per_s' rate, gauges a '_peak' high-water mark, timers '_count',
+        '_mean' and '_max', and delta samplers a '_delta'.
+
+        :rtype: dict
+        """
+        with self.lock:
+            samplers = list(self._samplers.items()) if self.enabled else []
+
+        # Samplers may access the hardware: poll them without the lock held
+        sampled = {}
+        for name, (reference, delta) in samplers:
+            function = reference()
+            if function is None:
+                with self.lock:
+                    if self._samplers.get(name, (None,))[0] is reference:
+                        del self._samplers[name]
+                        self._previous.pop(name, None)
+                continue
+
+            try:
+                sampled[name] = (function(), delta)
+            except Exception:
+                self.logger.debug("Sampler %s failed", name, exc_info=True)
+
+        with self.lock:
+            elapsed = time.monotonic() - self._t0
+            snapshot = {'elapsed': elapsed}
+
+            for name, value in self._counters.items():
+                snapshot[name] = value
+                snapshot[name + '_per_s'] = value/elapsed if elapsed > 0 else 0
+
+            for name, (value, peak) in self._gauges.items():
+                snapshot[name] = value
+                snapshot[name + '_peak'] = peak
+
+            for name, (count, total, longest) in self._timers.items():
+                snapshot[name + '_count'] = count
+                snapshot[name + '_mean'] = total/count
+                snapshot[name + '_max'] = longest
+
+            for sampler, (values, delta) in sampled.items():
+                if not isinstance(values, dict):
+                    values = {None: values}
+
+                for key, value in values.items():
+                    name = sampler if key is None else '%s_%s' % (sampler, key)
+                    snapshot[name] = value
+                    if delta:
+                        snapshot[name + '_delta'] = value - self._previous.get(name, value)
+                        self._previous[name] = value
+
+        return snapshot
+
+    @staticmethod
+    def format(snapshot):
+        """Formats a snapshot as a single line
+
+        :param dict snapshot: Snapshot to format
+        :rtype: str
+        """
+        return ' '.join('%s=%.4g' % (name, value) if isinstance(value, float) else '%s=%s' % (name, value)
+            for name, value in sorted(snapshot.items()))
+
+    def log(self, level=logging.INFO):
+        """Logs a snapshot of the metrics in a single line
+
+        :param int level: Logging level
+        """
+        self.logger.log(level, "Metrics: %s", self.format(self.snapshot()))
+
+    def start_logging(self, period=10, level=logging.INFO):
+        """Logs a snapshot of the metrics periodically, from a daemon thread
+
+        :param float period: Seconds between snapshots
+        :param int level: Logging level
+        """
+        self.stop_logging()
+
+        stop = threading.Event()
+        def run():
+            while not stop.wait(period):
+                self.log(level)
+
+        thread = threading.Thread(name='Metrics', target=run, daemon=True)
+        self._logging = (thread, stop)
+        thread.start()
+
+    def stop_logging(self):
+        """Stops the periodic logging, if running"""
+        if self._logging is None:
+            return
+
+        thread, stop = self._logging
+        stop.set()
+        thread.join()
+        self._logging = None
+
+METRICS = Metrics(enabled=os.environ.get('PYARCADIA_METRICS', '').strip().lower() not in ('', '0', 'false', 'no', 'off'))
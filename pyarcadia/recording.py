@@ -0,0 +1,275 @@
+##
+# @file recording.py
+#
+# @brief Raw packet recordings
+#
+# @section description_recording Description
+# While recording (see Chip.record_start), the C++ FIFO reader appends every
+# block of packets read from the FPGA to a file, after a small header holding
+# the chip id, a snapshot of the GCRs and the timestamp resolution. The file
+# layout is documented in DAQBoard_comm.cpp.
+#
+# Recordings are mapped in memory, so that their packets can be analyzed
+# without being loaded:
+#
+#   rec = Recording('run.bin')
+#   seq = Sequence(rec.packets, columnar=True)
+#
+# Recorded packets can also be replayed, in place of a chip, to elaborate
+# them offline (see Replay and ScanTest.replay).
+
+import time
+import datetime
+import numpy as np
+
+from .gcr import GCR_MAP
+from .data import FPGAData, KIND_DATA, KIND_TP, as_words, decode, rebase_timestamps
+
+RECORDING_MAGIC = b'ARCADIAR'
+RECORDING_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic',         'S8'),
+    ('version',       '<u4'),
+    ('header_size',   '<u4'),
+    ('chip_id',       '<u4'),
+    ('gcr_count',     '<u4'),
+    ('ts_resolution', '<f8'),
+    ('start_time',    '<u8')
+])
+
+def write_header(handle, chip_id, gcr, ts_resolution=0):
+    """Writes the header of a recording, as ChipIf.record_start does
+
+    :param handle: File open for binary writing
+    :param int chip_id: Chip id
+    :param list[int] gcr: GCR words
+    :param float ts_resolution: Timestamp resolution in seconds, 0 if unknown
+    """
+    gcr = np.asarray(gcr, dtype='<u2')
+    gcr_bytes = (2*len(gcr) + 7) & ~7
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = RECORDING_MAGIC
+    header['version'] = RECORDING_VERSION
+    header['header_size'] = HEADER_DTYPE.itemsize + gcr_bytes
+    header['chip_id'] = chip_id
+    header['gcr_count'] = len(gcr)
+    header['ts_resolution'] = ts_resolution
+    header['start_time'] = int(datetime.datetime.now().timestamp()*1E9)
+
+    handle.write(header.tobytes())
+    handle.write(gcr.tobytes().ljust(gcr_bytes, b'\0'))
+
+class Recording:
+    """Raw packets recorded from a chip, mapped in memory
+
+    :param str filename: Recording to open
+    :raises ValueError: If the file is not a recording
+
+    :ivar int chip_id: Id of the recorded chip
+    :ivar float ts_resolution: Timestamp resolution in seconds, None if unknown
+    :ivar datetime.datetime start_time: Beginning of the recording
+    :ivar numpy.ndarray gcr: GCR words when the recording started
+    :ivar numpy.ndarray packets: Packets, read-only and mapped in memory
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+        header = np.fromfile(filename, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header['magic'][0] != RECORDING_MAGIC:
+            raise ValueError("%s is not a packets recording" % filename)
+
+        header = header[0]
+        if header['version'] != RECORDING_VERSION:
+            raise ValueError("Unsupported recording version %d" % header['version'])
+
+        self.chip_id = int(header['chip_id'])
+        self.ts_resolution = float(header['ts_resolution']) or None
+        self.start_time = datetime.datetime.fromtimestamp(int(header['start_time'])/1E9)
+        self.gcr = np.fromfile(filename, dtype='<u2', count=int(header['gcr_count']), offset=HEADER_DTYPE.itemsize)
+
+        # A recording in progress may end with a partially written packet
+        header_size = int(header['header_size'])
+        with open(filename, 'rb') as handle:
+            handle.seek(0, 2)
+            count = (handle.tell() - header_size)//8
+
+        if count > 0:
+            self.packets = np.memmap(filename, dtype='<u8', mode='r', offset=header_size, shape=(count,))
+        else:
+            self.packets = np.empty(0, dtype='<u8')
+
+    def __len__(self):
+        return len(self.packets)
+
+    def gcrs(self):
+        """Returns the GCR parameters when the recording started, as
+        Chip.dump_gcrs does
+
+        :returns: Values by GCR parameter
+        :rtype: dict
+        """
+        return {gcrpar: (int(self.gcr[addr]) >> offset) & mask for gcrpar, (addr, mask, offset, _) in sorted(GCR_MAP.items()) if addr < len(self.gcr)}
+
+def load_packets(filename):
+    """Maps in memory the packets saved in a file: either a recording, a .npy
+    array, or raw 64-bit packets as returned by Chip.packets_read.
+
+    :param str filename: File to read the packets from
+    :returns: Packets, and the Recording if the file is one
+    :rtype: tuple(numpy.ndarray, Recording)
+    """
+    with open(filename, 'rb') as handle:
+        magic = handle.read(8)
+
+    if magic == RECORDING_MAGIC:
+        recording = Recording(filename)
+        return (recording.packets, recording)
+
+    if magic.startswith(b'\x93NUMPY'):
+        return (np.load(filename, mmap_mode='r'), None)
+
+    if len(magic) == 0:
+        return (np.empty(0, dtype=np.uint64), None)
+
+    return (np.memmap(filename, dtype='<u8', mode='r'), None)
+
+class Replay:
+    """Replays saved packets, standing in for a Chip as the packets source of
+    a Sequence: it implements packets_read, readout and packets_count.
+
+    Packets are returned as fast as possible, or paced by their timestamps:
+    with speed 1 they are returned as they had been received, with speed 2
+    twice as fast.
+
+    :param source: Packets, or file to read them from, see load_packets
+    :type source: numpy.ndarray | str
+    :param int chunk: Maximum number of packets returned by each read
+    :param float speed: Optional, replay speed w.r.t. real time. By default, as fast as possible
+    :param float ts_us: Optional, timestamp resolution in us. By default, the one of
+        the recording, if known
+    :raises ValueError: If pacing is requested, but the timestamp resolution is not known
+
+    :ivar int position: Packets returned so far
+    :ivar dict gcrs: GCR parameters of the recording, None if unknown
+    """
+    def __init__(self, source, chunk=32768, speed=None, ts_us=None):
+        recording = None
+        if isinstance(source, Recording):
+            recording = source
+            packets = source.packets
+        elif isinstance(source, str):
+            packets, recording = load_packets(source)
+        else:
+            packets = source
+
+        self.packets = as_words(packets)
+        self.chunk = chunk
+        self.speed = speed
+        self.ts_us = ts_us
+        self.gcrs = None
+        self.id = 0
+
+        if recording is not None:
+            self.id = recording.chip_id
+            self.gcrs = recording.gcrs()
+            if self.ts_us is None and recording.ts_resolution is not None:
+                self.ts_us = recording.ts_resolution*1E6
+
+        if self.speed and self.ts_us is None:
+            raise ValueError("The timestamp resolution is needed to pace the replay")
+
+        self.position = 0
+        self.reading = False
+        self._times = None
+        self._t0 = None
+
+    def __len__(self):
+        return len(self.packets)
+
+    def _release_times(self):
+        """Seconds after the beginning of the replay at which each packet is
+        returned. Words without a timestamp follow the preceding packets.
+        """
+        ticks = np.empty(len(self.packets), dtype=np.int64)
+        ts_sw = 0
+
+        for start in range(0, len(self.packets), 1 << 20):
+            table = decode(self.packets[start:start + (1 << 20)])
+            overflows = int(table['ts_sw'][-1])
+            rebase_timestamps(table, ts_sw)
+            ts_sw += overflows
+
+            timed = (table['kind'] == KIND_DATA) | (table['kind'] == KIND_TP)
+            ticks[start:start+len(table)] = np.where(timed, table['ts_ext'], -1)
+
+        np.maximum.accumulate(ticks, out=ticks)
+
+        first = ticks[ticks >= 0]
+        ticks -= first[0] if len(first) > 0 else 0
+        np.maximum(ticks, 0, out=ticks)
+
+        return ticks*(self.ts_us*1E-6/self.speed)
+
+    def _available(self):
+        if not self.speed:
+            return len(self.packets)
+
+        if self._times is None:
+            self._times = self._release_times()
+
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+
+        return int(np.searchsorted(self._times, time.monotonic() - self._t0, side='right'))
+
+    def exhausted(self):
+        """Returns True once all the packets have been returned
+
+        :rtype: bool
+        """
+        return self.position >= len(self.packets)
+
+    def rewind(self):
+        """Restarts the replay from the first packet"""
+        self.position = 0
+        self._t0 = None
+
+    def packets_count(self):
+        return self._available() - self.position
+
+    def packets_reset(self):
+        # Replayed packets are never discarded
+        pass
+
+    def packets_read_start(self):
+        self.reading = True
+
+    def packets_read_stop(self):
+        self.reading = False
+
+    def packets_read_active(self):
+        return self.reading and not self.exhausted()
+
+    def packets_read(self, num_packets=0):
+        """Returns the next packets of the replay, as Chip.packets_read does
+
+        :param int num_packets: Optional, maximum number of packets to return
+        :returns: Packets, a read-only view when replaying from a file
+        :rtype: numpy.ndarray[uint64]
+        """
+        end = self._available()
+        if self.chunk:
+            end = min(end, self.position + self.chunk)
+
+        if num_packets:
+            end = min(end, self.position + num_packets)
+
+        packets = self.packets[self.position:end]
+        self.position = max(self.position, end)
+
+        return np.asarray(packets)
+
+    def readout(self, max_packets=32768):
+        return FPGAData.from_packets(self.packets_read(max_packets))
@@ -1,15 +1,149 @@
+import os
 import time
+import copy
 import math
-import bisect
+import operator
+import tempfile
+import collections
+import contextlib
 import threading
-from tabulate import tabulate
+import multiprocessing
+import concurrent.futures
+import numpy as np
 """
 from tqdm import tqdm
 print = tqdm.write
 """
 
 from .daq import Chip
-from .data import ChipData, TestPulse, CustomWord
+from .metrics import METRICS
+from .data import ChipData, TestPulse, CustomWord, PACKET_DTYPE, KIND_DATA, KIND_TP, KIND_WORD, KIND_OVERFLOW, as_words, decode, extend_timestamps, rebase_timestamps, materialize, materialize_table, squash, squash_masters, tag_injections, TAG_NAMES
+
+def available_cpus():
+    """Number of CPUs this process can run on
+
+    :rtype: int
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def worker_context():
+    """Multiprocessing context of the worker processes: forkserver where
+    available, spawn otherwise. Unlike fork, both are safe while other
+    threads run, but execute the main module again in each worker, so
+    scripts starting workers must be guarded by ``if __name__ == '__main__':``.
+
+    :rtype: multiprocessing.context.BaseContext
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+class ElaborationPool:
+    """Pool of worker processes decoding FPGA packets in parallel, out of
+    the reach of the GIL. Workers receive raw 64-bit words and send back
+    decoded tables (see data.decode).
+
+    The number of workers is chosen by a cost model, whose two terms are
+    measured on the fly: the rate at which this process decodes packets,
+    and the overhead of dispatching a chunk to a worker. Workers are only
+    started once the serial decoding time of a chunk exceeds probe_time,
+    which is when parallel decoding may pay off; scripts decoding such
+    chunks must be guarded by ``if __name__ == '__main__':`` (see
+    worker_context).
+
+    :ivar int max_workers: Maximum number of worker processes
+    :ivar float probe_time: Serial decoding time, in seconds, above which
+        the workers are started and their overhead measured
+    """
+    max_workers = min(8, available_cpus())
+    probe_time = 10E-3
+
+    def __init__(self):
+        self.rate = None
+        self.overhead = None
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _average(old, new, weight=0.2):
+        return new if old is None else (1-weight)*old + weight*new
+
+    def start(self):
+        """Starts the worker processes, if not running yet
+
+        :returns: Whether the pool is running
+        :rtype: bool
+        """
+        with self.lock:
+            if self.executor is None and self.max_workers > 1:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.max_workers, mp_context=worker_context())
+
+                # Warm up, then time the round trip of a chunk on the running workers
+                list(self.executor.map(decode, [np.empty(0, dtype=np.uint64)]*self.max_workers))
+                t0 = time.perf_counter()
+                list(self.executor.map(decode, [np.empty(0, dtype=np.uint64)]*self.max_workers))
+                self.overhead = (time.perf_counter() - t0)/self.max_workers
+
+            return self.executor is not None
+
+    def workers(self, packets):
+        """Number of workers minimizing the expected decoding time: the
+        serial time split among the workers, plus their dispatch overhead.
+
+        :param int packets: Number of packets to decode
+        :rtype: int
+        """
+        if self.rate is None or self.max_workers < 2:
+            return 1
+
+        # Workers are started, and their overhead measured, on the first
+        # chunk slow enough to be worth splitting
+        serial = packets/self.rate
+        if self.executor is None and (serial < self.probe_time or not self.start()):
+            return 1
+
+        workers = int(math.sqrt(serial/self.overhead)) if self.overhead > 0 else self.max_workers
+        return max(1, min(self.max_workers, workers))
+
+    def decode(self, words, workers=None):
+        """Decodes packets, in chunks of consecutive packets. Each chunk is
+        decoded on its own, as if it was the beginning of a Sequence.
+
+        :param numpy.ndarray[uint64] words: Packets to decode
+        :param int workers: Optional, number of worker processes. 1 decodes in this process
+        :returns: Decoded chunks, in order
+        :rtype: list[numpy.ndarray[PACKET_DTYPE]]
+        """
+        if workers is None:
+            workers = self.workers(len(words))
+        elif workers > 1 and not self.start():
+            workers = 1
+
+        t0 = time.perf_counter()
+        if workers <= 1:
+            tables = [decode(words)]
+            elapsed = time.perf_counter() - t0
+            if len(words) > 0:
+                self.rate = self._average(self.rate, len(words)/max(elapsed, 1E-9))
+
+            METRICS.observe('decode', elapsed)
+            METRICS.count('packets_decoded', len(words))
+            return tables
+
+        tables = list(self.executor.map(decode, np.array_split(words, workers)))
+
+        # Whatever exceeds the parallel decoding time is overhead
+        elapsed = time.perf_counter() - t0
+        if self.rate is not None:
+            self.overhead = self._average(self.overhead, max(0, elapsed - len(words)/(self.rate*workers))/workers)
+
+        METRICS.observe('decode', elapsed)
+        METRICS.count('packets_decoded', len(words))
+        return tables
+
+ELABORATION_POOL = ElaborationPool()
 
 class SubSequence:
     """A SubSequence is a chain of data packets received from the FPGA
@@ -48,6 +182,15 @@ class SubSequence:
         """
         return [x for x in self._queue if isinstance(x, ChipData)]
 
+    def get_data_table(self):
+        """Returns the data packets in the SubSequence, decoded in a table
+        (see data.decode), in the same order as get_data
+        :returns: All the data packets
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        data = self.get_data()
+        return decode(np.fromiter(map(operator.attrgetter('fpga_packet.word'), data), dtype=np.uint64, count=len(data)))
+
     def get_tps(self):
         """Returns the test pulses in the SubSequence
         :returns: All the test pulses
@@ -81,99 +224,50 @@ class SubSequence:
         """
         self._queue.extend(other._queue)
 
-    def squash_data(self, threads=None):
-        """Merges packets from the same Master by OR-ing the pixels
-        they contain.
-
-        Doesn't currently support Smart Readout packets
+    def rebase(self, ts_sw):
+        """Offsets the software timestamp of the packets in the SubSequence
+        :param int ts_sw: Timestamp overflows to add
         """
+        for packet in self._queue:
+            if isinstance(packet, (TestPulse, ChipData)):
+                packet.ts_sw += ts_sw
+                packet.extend_timestamp()
 
-        # Worker
-        def worker(data, results):
-            # Elaborate
-            new_data = []
-            tmp = data[0]
-            old_idx = data[0].master_idx()
-
-            for i in data:
-                this_idx = i.master_idx()
+    def _at(self, item):
+        return self._queue[item]
 
-                if this_idx != old_idx:
-                    tmp.bottom = 1
-                    new_data.append(tmp)
-                    tmp = i
-                else:
-                    tmp.hitmap |= i.hitmap
+    def _pop_at(self, item):
+        return self._queue.pop(item)
 
-                old_idx = this_idx
+    def squash_data(self, threads=None):
+        """Merges packets from the same Master by OR-ing the pixels
+        they contain. The packets in the SubSequence are left untouched.
 
-            # Account for any last loner
-            new_data.append(tmp)
-            results.extend(new_data)
+        Doesn't currently support Smart Readout packets, which are left out
 
-        # Initialize processing
+        :param threads: Unused, kept for compatibility
+        :returns: A copy of the first packet from each Master, holding the
+            merged hitmap, by descending Master index
+        :rtype: list[ChipData]
+        """
         data = self.get_data()
+        first, hitmaps = squash_masters(self.get_data_table())
 
-        # Remove smart packets
-        data = [x for x in data if x.bottom == 1 or (x.hitmap & 0xf) == 0]
-        lendata = len(data)
-
-        if lendata == 0:
-            return []
-
-        start_time = time.time()
-        data.sort(key=lambda x: x.master_idx(), reverse=True)
-
-        if threads is None:
-            threads = max(1, min(8, int(lendata/2048)))
-
-        per_thread = int(math.ceil(lendata/threads))
+        squashed = []
+        for i, hitmap in zip(first.tolist(), hitmaps.tolist()):
+            tmp = copy.copy(data[i])
+            tmp.hitmap = hitmap
+            tmp.bottom = 1
+            squashed.append(tmp)
 
-        if threads > 1:
-            workers = []
-            results = []
-            for i in range(threads):
-                results.append([])
-                start = i*per_thread
-                stop = lendata if i == threads-1 else (i+1)*per_thread
-                workers.append(threading.Thread(name='Squasher%d' % i, target=worker, args=(data[start:stop], results[i])))
-                workers[i].start()
-
-            for i in range(threads):
-                workers[i].join()
-
-            flat = [item for sublist in results for item in sublist]
-        else:
-            flat = data
-
-        # Last mergeup
-        flat_results = []
-        worker(flat, flat_results)
-
-        time_delta = time.time() - start_time
-        #print("Squashed %d data to %d in %s us w/ %d threads" % (lendata, len(flat_results), time_delta*1E6, threads))
-
-        return flat_results
+        return squashed
 
     def __getitem__(self, item):
         if self.parent is not None and self.parent.autoread:
-            elapsed = 0
-            while True:
-                if self.parent.timeout is not None and elapsed > self.parent.timeout:
-                    raise RuntimeError("Pop timed out")
-
-                self.parent.lock.acquire()
-                if item >= len(self._queue):
-                    self.parent.lock.release()
-                    time.sleep(0.5)
-                    elapsed += 0.5
-                    continue
+            with self.parent.wait_until(lambda: -len(self) <= item < len(self), strict=True):
+                return self._at(item)
 
-                tmp = self._queue[item]
-                self.parent.lock.release()
-                return tmp
-
-        return self._queue[item]
+        return self._at(item)
 
     def pop(self, item=-1):
         """Pops an element from the queue, fetches more packets
@@ -184,29 +278,24 @@ class SubSequence:
         """
 
         if self.parent is not None and self.parent.autoread:
-            elapsed = 0
-            while True:
-                if self.parent.timeout is not None and elapsed > self.parent.timeout:
-                    raise RuntimeError("Pop timed out")
+            with self.parent.wait_until(lambda: -len(self) <= item < len(self), strict=True):
+                return self._pop_at(item)
 
-                self.parent.lock.acquire()
-                if item >= len(self._queue):
-                    self.parent.lock.release()
-                    time.sleep(0.5)
-                    elapsed += 0.5
-                    continue
-
-                tmp = self._queue.pop(item)
-                self.parent.lock.release()
-                return tmp
-
-        return self._queue.pop(item)
+        return self._pop_at(item)
 
     def filter_double_injections(self, us_on=10, fe_ntol=4, fe_ptol=4, tp_ntol=4, tp_ptol=1):
         """Filters spurious injections due to the falling edge of the
         Test Pulse coupling with the injection circuitry in the FEs.
-
-        :param int t_off: Delta of the TP falling edge w.r.t. the rising
+        Data packets are tagged as 'isolated', 'rising edge', 'falling edge'
+        or 'ambiguous', see data.tag_injections.
+
+        :param int us_on: Test Pulse duration, in us
+        :param int fe_ntol: Falling edge tolerance before the expected timestamp
+        :param int fe_ptol: Falling edge tolerance after the expected timestamp
+        :param int tp_ntol: Rising edge tolerance before the expected timestamp
+        :param int tp_ptol: Rising edge tolerance after the expected timestamp
+        :returns: Tag of each data packet, see data.TAG_NAMES
+        :rtype: numpy.ndarray[uint8]
         """
         if self.parent is None:
             raise RuntimeError("The SubSequence doesn't have a valid parent Sequence. Unable to continue")
@@ -217,86 +306,38 @@ class SubSequence:
         # t_on is in FPGA CCs. Translate into timestamp counts
         ts_delta = int(us_on/Chip.ts_us)
 
-        t0 = time.time()
-        tps = [tp.ts_ext for tp in self.get_tps()]
-        data = [data for data in self.get_data()]
-        #print("Sorting took {}".format(time.time()-t0)); t0=time.time()
-
-        # Parallel analysis
-        def split_packets(data, data_ser):
-            for packet in data:
-                data_ser[packet.ser].append(packet)
-
-        data_ser = [[] for i in range(16)]
-        if len(data) > 1000:
-            per_thread = 600
-            workers = []
-            threads = math.floor(len(data)/per_thread)
-
-            for thread in range(threads):
-                ub = min(((thread+1)*per_thread), len(data))
-                t = threading.Thread(name='Splitter%d' % thread, target=split_packets, args=(data[thread*600:ub], data_ser, ))
-                t.start()
-                workers.append(t)
-
-            for t in range(threads):
-                workers[t].join()
-
-        else:
-            split_packets(data, data_ser)
-
-        #print("Splitting took {}".format(time.time()-t0)); t0=time.time()
-
-        # Parallel analysis
-        def parse_packets(tps, data):
-            parsed = []
-            for packet in data:
-                # Check whether it corresponds to a Test Pulse
-                found_tp = bisect.bisect_left(tps, packet.ts_ext - 5 - tp_ntol)
-                found_tp = found_tp != len(tps) and tps[found_tp] <= packet.ts_ext - 5 + tp_ptol
-
-                # Check whether there is an already parsed packet which matches
-                found_re = bisect.bisect_left(parsed, packet.ts_ext - ts_delta - fe_ntol)
-                found_re = found_re != len(parsed) and parsed[found_re] <= packet.ts_ext - ts_delta + fe_ptol
-
-                if not found_re and not found_tp:
-                    packet.tag = 'isolated'
-
-                elif found_re and not found_tp:
-                    packet.tag = 'falling edge'
-
-                elif not found_re and found_tp:
-                    packet.tag = 'rising edge'
-                    parsed.append(packet.ts_ext)
-
-                elif found_re and found_tp:
-                    packet.tag = 'ambiguous'
-                    parsed.append(packet.ts_ext)
+        data = self.get_data()
+        ts_ext, ser = self._columns(data, 'ts_ext', 'ser')
+        tps, = self._columns(self.get_tps(), 'ts_ext')
 
-        for thread in range(16):
-            threads = []
+        tags = tag_injections(ts_ext, ser, tps, ts_delta, fe_ntol, fe_ptol, tp_ntol, tp_ptol)
+        self._tag(data, tags)
 
-            t = threading.Thread(name='Parser%d' % thread, target=parse_packets, args=(tps, data_ser[thread]))
-            t.start()
-            threads.append(t)
+        return tags
 
-        for t in threads:
-            t.join()
+    @staticmethod
+    def _columns(packets, *fields):
+        return tuple(np.fromiter(map(operator.attrgetter(field), packets), dtype=np.int64, count=len(packets)) for field in fields)
 
-        #print("Parsing took {}".format(time.time()-t0)); t0=time.time()
+    @staticmethod
+    def _tag(data, tags):
+        for packet, tag in zip(data, tags.tolist()):
+            packet.tag = TAG_NAMES[tag]
 
     def dump(self, limit=0, start=0):
         """Prints a dump of the packets contained in the SubSequence.
         :param int limit: How many packets to show
         :param int start: Index of the first packet to show
         """
+        from tabulate import tabulate
+
         i = 0
         toprint = []
 
         ts_base = None
         while limit == 0 or i < limit:
             try:
-                item = self._queue[start+i]
+                item = self._at(start+i)
             except IndexError:
                 break
 
@@ -316,28 +357,251 @@ class SubSequence:
         print(tabulate(toprint, headers=["#", "Timestamp", "Item"]))
 
 
+class ColumnarSubSequence(SubSequence):
+    """A SubSequence backed by a single decoded packet table (see
+    data.decode) instead of a list of packet objects. The packets
+    accessors return the matching rows of the table, while indexing
+    and popping return packet objects, so that the control flow of
+    the tests is unchanged.
+
+    :param packets: Initialization packets from FPGA
+    :type packets: numpy.ndarray | list[int] | list[FPGAData]
+    :param Sequence parent: Optional, parent Sequence
+    """
+
+    _chunks = None
+
+    def __init__(self, packets=None, parent=None):
+        self._chunks = []
+        self.parent = parent
+        self.ts_sw = 0
+
+        seq = self if parent is None else parent
+
+        if packets is not None:
+            self.append(ColumnarSubSequence.elaborate_table(packets, seq))
+
+    @staticmethod
+    def elaborate_table(packets, sequence):
+        """Decodes FPGA packets into a table, tagging each of them with the
+        software timestamp of the sequence, which is updated accordingly.
+        Timestamp overflow packets are dropped.
+
+        :param packets: Packets to decode
+        :type packets: numpy.ndarray | list[int] | list[FPGAData]
+        :param Sequence sequence: Sequence the packets belong to
+        :returns: Decoded packets
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        with METRICS.timer('decode'):
+            table = decode(packets)
+
+        METRICS.count('packets_decoded', len(table))
+        sequence.ts_sw = extend_timestamps(table, sequence.ts_sw)
+
+        return table[table['kind'] != KIND_OVERFLOW]
+
+    @property
+    def table(self):
+        """Decoded packet table. Appended chunks are merged on first access.
+
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        if len(self._chunks) == 0:
+            return np.empty(0, dtype=PACKET_DTYPE)
+
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+
+        return self._chunks[0]
+
+    def __len__(self):
+        return sum(len(x) for x in self._chunks)
+
+    def get_data(self):
+        """Returns the data packets in the SubSequence
+        :returns: All the data packets
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        table = self.table
+        return table[table['kind'] == KIND_DATA]
+
+    def get_data_table(self):
+        """Returns the data packets in the SubSequence
+        :returns: All the data packets
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        return self.get_data()
+
+    def get_tps(self):
+        """Returns the test pulses in the SubSequence
+        :returns: All the test pulses
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        table = self.table
+        return table[table['kind'] == KIND_TP]
+
+    def get_words(self):
+        """Returns the custom words in the SubSequence
+        :returns: All the Custom Words
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        table = self.table
+        return table[table['kind'] == KIND_WORD]
+
+    def is_complete(self):
+        """Returns True if the SubSequence is complete and terminated
+        with a CustomWord, otherwise False
+        :rtype: bool
+        """
+        return len(self._chunks) > 0 and self._chunks[-1]['kind'][-1] == KIND_WORD
+
+    def append(self, data):
+        """Appends new packets to the SubSequence
+        :param numpy.ndarray[PACKET_DTYPE] data: packets to attach
+        """
+        if len(data) > 0:
+            self._chunks.append(data)
+
+    def extend(self, other):
+        """Extends the current SubSequence with another one
+        :param ColumnarSubSequence other: SubSequence whose packets will be imported
+        """
+        self._chunks.extend(other._chunks)
+
+    def rebase(self, ts_sw):
+        """Offsets the software timestamp of the packets in the SubSequence
+        :param int ts_sw: Timestamp overflows to add
+        """
+        for chunk in self._chunks:
+            rebase_timestamps(chunk, ts_sw)
+
+    def to_objects(self):
+        """Builds the equivalent list-based SubSequence
+        :rtype: SubSequence
+        """
+        objects = SubSequence(parent=self.parent)
+        objects._queue = [materialize(x) for x in self.table]
+
+        return objects
+
+    def _at(self, item):
+        if isinstance(item, slice):
+            return self.table[item]
+
+        return materialize(self.table[item])
+
+    def _pop_at(self, item):
+        length = len(self)
+        if not -length <= item < length:
+            raise IndexError("pop index out of range")
+
+        item %= length
+
+        # Popping from either end leaves a view of the chunk, without copies
+        if item == 0:
+            tmp = materialize(self._chunks[0][0])
+            self._chunks[0] = self._chunks[0][1:]
+        elif item == length-1:
+            tmp = materialize(self._chunks[-1][-1])
+            self._chunks[-1] = self._chunks[-1][:-1]
+        else:
+            table = self.table
+            tmp = materialize(table[item])
+            self._chunks = [np.delete(table, item)]
+
+        self._chunks = [chunk for chunk in self._chunks if len(chunk) > 0]
+        return tmp
+
+    def squash_data(self, threads=None):
+        """Merges packets from the same Master by OR-ing the pixels
+        they contain.
+
+        Doesn't currently support Smart Readout packets, which are left out
+
+        :param threads: Unused, kept for compatibility
+        :returns: The first packet from each Master, holding the merged
+            hitmap, by descending Master index
+        :rtype: numpy.ndarray[PACKET_DTYPE]
+        """
+        return squash(self.get_data())
+
+    @staticmethod
+    def _columns(packets, *fields):
+        return tuple(packets[field] for field in fields)
+
+    @staticmethod
+    def _tag(data, tags):
+        # Tags are returned only, the table has no column for them
+        pass
+
+
 class Sequence:
     """A Sequence is a hierarchical structure which organizes the data
     coming from the FPGA by using CustomWords. It splits the packets
     received into SubSequences, creating a new one once a CustomWord
     is detected in the data stream.
+
+    While autoread is enabled, the packets held by the Sequence can be
+    bounded by max_packets. Once the budget is reached, the autoreader
+    applies the overflow policy:
+
+    * 'block': stops reading until SubSequences are popped. Packets are left
+      in the buffers of the chip interface and of the FPGA
+    * 'spill': stores the packets read, undecoded, to a temporary file in
+      spill_dir, and elaborates them once SubSequences are popped
+    * 'drop': discards the data packets read, keeping Test Pulses and
+      CustomWords so that the SubSequences are still delimited
+
+    The budget is enforced only while complete SubSequences are waiting to
+    be popped: a single SubSequence larger than the budget is still read,
+    otherwise it would never be completed.
+
+    :param FPGAData packets: Initialization packets from FPGA
+    :param bool autoread: Automatically read packets from the chip
+    :param Chip chip: Chip to read packets from
+    :param bool columnar: Store packets in ColumnarSubSequences
+    :param int max_packets: Optional, packets budget while autoread is enabled
+    :param str policy: Policy once the budget is reached: 'block', 'spill' or 'drop'
+    :param str spill_dir: Optional, directory of the spill file
     """
+    POLICIES = ('block', 'spill', 'drop')
+
     chip: object = None
     ts_sw = 0
     autoread = False
+    columnar = False
     tries = 5
+    max_packets = None
+    policy = 'block'
+    spill_dir = None
     _queue = None
     _popped = None
-    timeout = None
+    _timeout = None
+
+    def __init__(self, packets=None, autoread=False, chip=None, columnar=False, max_packets=None, policy='block', spill_dir=None):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown policy %s, expected one of %s" % (policy, ", ".join(self.POLICIES)))
 
-    def __init__(self, packets=None, autoread=False, chip=None):
         self.autoread = autoread
         self.chip = chip
+        self.columnar = columnar
+        self.max_packets = max_packets
+        self.policy = policy
+        self.spill_dir = spill_dir
         self._queue = []
         self._popped = []
         self.autoread_idle = 0
 
-        self.lock = threading.Lock()
+        self.packets_read = 0
+        self.packets_dropped = 0
+        self.packets_spilled = 0
+        self.packets_peak = 0
+        self.blocked_time = 0
+        self._spill = None
+        self._spilled = collections.deque()
+
+        self.lock = threading.Condition()
         self.autoread_thread = None
         if autoread:
             self.autoread_start()
@@ -347,26 +611,135 @@ class Sequence:
 
         self.elaborate_auto(packets)
 
+    def over_budget(self):
+        """Checks whether the packets budget is reached, while complete
+        SubSequences are waiting to be popped. To be called with the lock held.
+
+        :rtype: bool
+        """
+        if self.max_packets is None or len(self._queue) == 0:
+            return False
+
+        if len(self._queue) == 1 and not self._queue[0].is_complete():
+            return False
+
+        return self.total_length() >= self.max_packets
+
+    @property
+    def packets_pending_spill(self):
+        """Packets stored in the spill file, not yet elaborated"""
+        return sum(count for _, count in self._spilled)
+
+    def counters(self):
+        """Returns the counters of the autoreader
+
+        :returns: Packets read, held, at peak, dropped, spilled and pending
+            in the spill file, and seconds spent blocked
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'packets_read': self.packets_read,
+                'packets_held': self.total_length(),
+                'packets_peak': self.packets_peak,
+                'packets_dropped': self.packets_dropped,
+                'packets_spilled': self.packets_spilled,
+                'packets_pending_spill': self.packets_pending_spill,
+                'blocked_time': self.blocked_time
+            }
+
+    def _spill_write(self, words):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='pyarcadia_spill_', dir=self.spill_dir)
+
+        self._spill.seek(0, os.SEEK_END)
+        self._spilled.append((self._spill.tell(), len(words)))
+        self._spill.write(words.astype(np.uint64).tobytes())
+        self.packets_spilled += len(words)
+        METRICS.count('packets_spilled', len(words))
+
+    def _spill_read(self):
+        offset, count = self._spilled.popleft()
+        self._spill.seek(offset)
+        words = np.fromfile(self._spill, dtype=np.uint64, count=count)
+
+        # Drained: start over, so that the file does not grow indefinitely
+        if len(self._spilled) == 0:
+            self._spill.seek(0)
+            self._spill.truncate()
+
+        return words
+
+    def _autoread_extend(self, packets):
+        # Packets are extended from the current timestamp, no rebase needed
+        tmp = Sequence(columnar=self.columnar)
+        tmp.ts_sw = self.ts_sw
+        tmp.elaborate_auto(packets)
+
+        with self.lock:
+            self.extend(tmp, rebase=False)
+            held = self.total_length()
+            self.packets_peak = max(self.packets_peak, held)
+            METRICS.gauge('sequence_depth', len(self._queue))
+            METRICS.gauge('sequence_packets', held)
+            self.lock.notify_all()
+
     def __autoread(self):
         self.autoread_idle = 0
 
         while self.autoread:
             time.sleep(1E-3)
-            packets = self.chip.readout()
+
+            with self.lock:
+                over_budget = self.over_budget()
+
+                if over_budget and self.policy == 'block':
+                    t0 = time.monotonic()
+                    while self.autoread and self.over_budget():
+                        self.lock.wait(0.1)
+
+                    blocked = time.monotonic() - t0
+                    self.blocked_time += blocked
+                    METRICS.count('autoread_blocked_time', blocked)
+                    continue
+
+            # Spilled packets come first, to preserve the order
+            if not over_budget and len(self._spilled) > 0:
+                self._autoread_extend(self._spill_read())
+                continue
+
+            if METRICS.enabled:
+                METRICS.gauge('fifo_occupancy', self.chip.packets_count())
+
+            if self.columnar:
+                packets = self.chip.packets_read(32768)
+            else:
+                packets = self.chip.readout()
 
             if len(packets) == 0:
-                self.autoread_idle += 1E-3
+                # Not idle while spilled packets wait for elaboration
+                if len(self._spilled) == 0:
+                    self.autoread_idle += 1E-3
+                    METRICS.count('autoread_idle_time', 1E-3)
                 continue
 
             self.autoread_idle = 0
+            self.packets_read += len(packets)
+            METRICS.count('packets_read', len(packets))
 
-            tmp = Sequence()
-            tmp.elaborate_auto(packets)
+            if self.policy == 'spill' and (over_budget or len(self._spilled) > 0):
+                self._spill_write(as_words(packets))
+                continue
 
-            self.lock.acquire()
-            self.extend(tmp)
-            self.lock.release()
+            if self.policy == 'drop' and over_budget:
+                words = as_words(packets)
+                keep = (words >> np.uint64(60)) >= 0xa
+                dropped = int(len(words) - np.count_nonzero(keep))
+                self.packets_dropped += dropped
+                METRICS.count('packets_dropped', dropped)
+                packets = words[keep]
 
+            self._autoread_extend(packets)
 
     def autoread_start(self):
         self.autoread = True
@@ -374,53 +747,73 @@ class Sequence:
         self.autoread_thread.start()
 
     def elaborate_auto(self, packets):
-        t0 = time.time()
-        if len(packets) < 600:
-            self.elaborate(packets)
-        else:
-            self.elaborate_parallel(packets)
+        self.elaborate_parallel(packets)
 
-        #print("Elaboration took {}".format(time.time()-t0)); t0=time.time()
+    def elaborate_parallel(self, packets, workers=None):
+        """Elaborates new FPGA packets and inserts them in existing SubSequences.
+        Packets are decoded in chunks by the worker processes of the
+        ElaborationPool, then inserted in bulk.
 
-    def elaborate_parallel(self, packets):
-        per_thread = 500
-        threads = math.ceil(len(packets)/per_thread)
-        if threads > 8:
-            threads = 8
-            per_thread = math.ceil(len(packets)/8)
+        :param packets: The packets to process
+        :type packets: numpy.ndarray | list[int] | list[FPGAData]
+        :param int workers: Optional, number of worker processes. By default,
+            chosen by the ElaborationPool
+        """
+        for table in ELABORATION_POOL.decode(as_words(packets), workers):
+            # Chunks are decoded on their own: chain their timestamp overflows
+            overflows = int(table['ts_sw'][-1]) if len(table) > 0 else 0
+            rebase_timestamps(table, self.ts_sw)
+            self.ts_sw += overflows
+
+            self._append_table(table[table['kind'] != KIND_OVERFLOW])
+
+    @property
+    def timeout(self):
+        """Seconds to wait for packets while autoread is enabled, before
+        raising a RuntimeError. None waits indefinitely.
+        """
+        return self._timeout
 
-        workers = []
-        sequences = []
-        for i in range(threads):
-            sequence = Sequence()
-            stop = len(packets) if i == threads-1 else (i+1)*per_thread
-            thread = threading.Thread(name='Elaborator%d' % i, target=sequence.elaborate, args=(packets[i*per_thread:stop], ))
-            thread.start()
-            workers.append(thread)
-            sequences.append(sequence)
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
 
-        for worker in workers:
-            worker.join()
+        # Waits in progress apply the new timeout
+        with self.lock:
+            self.lock.notify_all()
 
-        for seq in sequences:
-            self.extend(seq)
+    @contextlib.contextmanager
+    def wait_until(self, ready, strict=False):
+        """Context manager waiting until the autoreader makes ready() True, and
+        holding the Sequence lock within it.
 
-    def __getitem__(self, item):
-        if self.autoread:
-            elapsed = 0
+        :param callable ready: Condition to wait for, checked with the lock held
+        :param bool strict: Time out only once the timeout is exceeded, rather than reached
+        :raises RuntimeError: If the timeout expires first
+        """
+        t0 = time.monotonic()
+
+        with self.lock:
             while True:
-                if self.timeout is not None and elapsed > self.timeout:
+                elapsed = time.monotonic() - t0
+                timeout = self.timeout
+                if timeout is not None and (elapsed > timeout if strict else elapsed >= timeout):
                     raise RuntimeError("Pop timed out")
 
-                self.lock.acquire()
-                if item >= len(self._queue) or not self._queue[item].is_complete():
-                    self.lock.release()
-                    time.sleep(0.5)
-                    continue
+                if ready():
+                    break
+
+                self.lock.wait(None if timeout is None else max(0, timeout - elapsed) + 1E-3)
 
-                tmp = self._queue[item]
-                self.lock.release()
-                return tmp
+            yield
+
+    def _complete(self, item):
+        return -len(self._queue) <= item < len(self._queue) and self._queue[item].is_complete()
+
+    def __getitem__(self, item):
+        if self.autoread:
+            with self.wait_until(lambda: self._complete(item), strict=True):
+                return self._queue[item]
 
         return self._queue[item]
 
@@ -437,25 +830,17 @@ class Sequence:
         """
 
         if self.autoread:
-            elapsed = 0
-            while True:
-                if self.timeout is not None and elapsed >= self.timeout:
-                    raise RuntimeError("Pop timed out")
-
-                self.lock.acquire()
-                if item >= len(self._queue) or not self._queue[item].is_complete():
-                    self.lock.release()
-                    time.sleep(0.5)
-                    elapsed += 0.5
-                    continue
-
+            with self.wait_until(lambda: self._complete(item)):
                 tmp = self._queue.pop(item)
-                self.lock.release()
+                METRICS.gauge('sequence_depth', len(self._queue))
 
-                if log:
-                    self._popped.append(tmp)
+                # Wakes the autoreader, if blocked on the packets budget
+                self.lock.notify_all()
 
-                return tmp
+            if log:
+                self._popped.append(tmp)
+
+            return tmp
 
         if log:
             self._popped.append(self._queue[item])
@@ -466,6 +851,10 @@ class Sequence:
         """Elaborates new FPGA packets and inserts them in existing SubSequences
         :param FPGAData packets: The packets to process
         """
+        if self.columnar:
+            self._elaborate_columnar(packets)
+            return
+
         for packet in packets:
             elaborated = packet.elaborate(self)
 
@@ -477,11 +866,37 @@ class Sequence:
 
             self._queue[-1].append(elaborated)
 
+    def _elaborate_columnar(self, packets):
+        self._append_table(ColumnarSubSequence.elaborate_table(packets, self))
+
+    def _append_table(self, table):
+        # Each Custom Word terminates a SubSequence
+        ends = np.flatnonzero(table['kind'] == KIND_WORD) + 1
+        if self.columnar:
+            chunks = np.split(table, ends)
+        else:
+            packets = materialize_table(table, self)
+            chunks = [packets[start:stop] for start, stop in zip(np.r_[0, ends], np.r_[ends, len(packets)])]
+
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+
+            if len(self._queue) == 0 or self._queue[-1].is_complete():
+                self._queue.append(ColumnarSubSequence(parent=self) if self.columnar else SubSequence(parent=self))
+
+            if self.columnar:
+                self._queue[-1].append(chunk)
+            else:
+                self._queue[-1]._queue.extend(chunk)
+
     def dump(self, limit=0, start=0):
         """Prints a dump of the packets contained in the SubSequence.
         :param int limit: How many packets to show
         :param int start: Index of the first packet to show
         """
+        from tabulate import tabulate
+
         i = 0
         toprint = []
 
@@ -504,27 +919,29 @@ class Sequence:
 
         return total
 
-    def extend(self, other):
-        """Extend the current Sequence with another one"""
+    def extend(self, other, rebase=True):
+        """Extend the current Sequence with another one
+
+        :param Sequence other: Sequence whose SubSequences will be imported
+        :param bool rebase: Whether other's timestamps are relative to its beginning.
+            If False, other was elaborated starting from this Sequence's ts_sw
+        """
+        ts_sw = self.ts_sw
+        self.ts_sw = ts_sw + other.ts_sw if rebase else other.ts_sw
 
         # Trivial case
         if len(other._queue) == 0:
             return
 
-        # Merge middle subsequences, if necessary
-        if len(self._queue) > 0 and not self._queue[-1].is_complete():
-            self._queue[-1].extend(other._queue.pop(0))
-
         # Timestamp adjustment
         for subsequence in other._queue:
             subsequence.parent = self
+            if rebase:
+                subsequence.rebase(ts_sw)
 
-            for packet in subsequence._queue:
-                if isinstance(packet, (TestPulse, ChipData)):
-                    packet.ts_sw += self.ts_sw
-                    packet.extend_timestamp()
-
-        self.ts_sw += other.ts_sw
+        # Merge middle subsequences, if necessary
+        if len(self._queue) > 0 and not self._queue[-1].is_complete():
+            self._queue[-1].extend(other._queue.pop(0))
 
         if len(self._queue) == 0:
             self._queue = other._queue
@@ -7,8 +7,7 @@ import os
 import codecs
 import json
 import datetime
-import matplotlib
-import matplotlib.pyplot as plt
+import numpy as np
 import tqdm
 
 from .daq import Fpga, Chip, onecold
@@ -447,23 +446,47 @@ class Test:
     def serialize(self):
         raise NotImplementedError()
 
+    def serialize_arrays(self):
+        """Returns the test results for the binary file format
+
+        :returns: Arrays by name, and JSON serializable attributes
+        :rtype: tuple(dict, dict)
+        """
+        raise NotImplementedError()
+
+    def deserialize_arrays(self, arrays, attrs):
+        """Restores the test results from the binary file format
+
+        :param arrays: Arrays by name. The archive is closed when this returns,
+            so every array needed must be read here
+        :type arrays: numpy.lib.npyio.NpzFile
+        :param dict attrs: Attributes returned by serialize_arrays
+        """
+        raise NotImplementedError()
+
     def run(self):
         """Saves the starting GCRs and runs the test
         """
         self.gcrs = self.chip.dump_gcrs(False)
         self._run()
 
-    def save(self, saveas=None):
+    def save(self, saveas=None, fmt='json'):
         """Saves the GCR configuration and test results to file. If the filename is not
         provided, the results will be saved into date folders, and incrementally indexed
         timed files in those folders.
 
+        The results are saved either as JSON, or as compressed arrays in a NumPy
+        .npz archive, with the GCRs stored alongside them as attributes. Files
+        ending in .npz are always saved in the binary format.
+
         :param string saveas: (Optional) File to save the results to
+        :param string fmt: (Optional) File format, either 'json' or 'npz'
         """
+        if fmt not in ('json', 'npz'):
+            raise ValueError("Unknown file format %s, expected either json or npz" % fmt)
 
-        listed = []
-        listed.append(self.gcrs)
-        listed.extend(self.serialize())
+        if saveas is not None and saveas.endswith('.npz'):
+            fmt = 'npz'
 
         idx = 0
         if saveas is None:
@@ -493,15 +516,40 @@ class Test:
             idx = last_idx+1
 
             time = datetime.datetime.now().strftime("%H_%M_%S")
-            saveas = os.path.join(folder, "run__" + str(idx) + "__" + time + ".json")
+            saveas = os.path.join(folder, "run__" + str(idx) + "__" + time + "." + fmt)
+
+        elif fmt == 'npz' and not saveas.endswith('.npz'):
+            saveas += '.npz'
+
+        saveas = self._filename(saveas)
+
+        if fmt == 'npz':
+            self._save_npz(saveas)
+        else:
+            listed = []
+            listed.append(self.gcrs)
+            listed.extend(self.serialize())
 
-        json.dump(listed, codecs.open(self._filename(saveas), 'w', encoding='utf-8'), separators=(',', ':'), sort_keys=True, indent=4)
+            json.dump(listed, codecs.open(saveas, 'w', encoding='utf-8'), separators=(',', ':'), sort_keys=True, indent=4)
 
         print("Test results and configuration saved in:\n%s" % saveas)
-        return saveas 
+        return saveas
+
+    def _save_npz(self, saveas):
+        arrays, attrs = self.serialize_arrays()
+
+        meta = {
+            'test': type(self).__name__,
+            'gcrs': self.gcrs,
+            'attrs': attrs
+        }
+
+        with open(saveas, 'wb') as handle:
+            np.savez_compressed(handle, __meta__=np.array(json.dumps(meta, sort_keys=True)), **arrays)
 
     def load(self, filename):
-        """Loads the GCR configuration and test results from a file.
+        """Loads the GCR configuration and test results from a file, either
+        JSON or NumPy .npz as chosen by its contents.
 
         :param string filename: File to read the results from
         """
@@ -509,6 +557,14 @@ class Test:
             print("Unable to load %s. Not found." % filename)
             return
 
+        with open(filename, 'rb') as handle:
+            magic = handle.read(4)
+
+        # .npz archives are zip files
+        if magic == b'PK\x03\x04':
+            self._load_npz(filename)
+            return
+
         with codecs.open(filename, 'r', encoding='utf-8') as handle:
             try:
                 contents = json.loads(handle.read())
@@ -522,6 +578,13 @@ class Test:
 
             self.deserialize(contents)
 
+    def _load_npz(self, filename):
+        with np.load(filename, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['__meta__']))
+
+            self.gcrs = meta['gcrs']
+            self.deserialize_arrays(arrays, meta['attrs'])
+
     def _plot_points(self, fig, ax, **kwargs):
         raise NotImplementedError()
 
@@ -532,6 +595,9 @@ class Test:
         raise NotImplementedError()
 
     def _plot_footer(self, fig, show, saveas, title, notes, saveas_append=""):
+        import matplotlib
+        from matplotlib import pyplot as plt
+
         title = self.title + (title if title is not None else '')
 
         fig.suptitle(title)
@@ -553,6 +619,8 @@ class Test:
             plt.close(fig)
 
     def plot_heatmap(self, show=True, saveas=None, title=None, notes=None, **kwargs):
+        from matplotlib import pyplot as plt
+
         if not show and saveas is None:
             raise ValueError('Either show or save the plot!')
 
@@ -565,6 +633,8 @@ class Test:
         self._plot_footer(fig, show, saveas, title, notes)
 
     def plot_points(self, show=True, saveas=None, title=None, notes=None, **kwargs):
+        from matplotlib import pyplot as plt
+
         if not show and saveas is None:
             raise ValueError('Either show or save the plot!')
 
@@ -110,27 +110,28 @@ class BaselineScan(ScanTest):
 
             masked = 0
             seen_again = 0
-            for data in squashed:
-                slave_hitmap = data.hitmap & 0xf
-                if slave_hitmap != 0:
-                    self.chip.pixels_cfg(0b11, [data.sec], [data.col], [data.corepr], [0], slave_hitmap)
+            with self.chip.transaction():
+                for data in squashed:
+                    slave_hitmap = data.hitmap & 0xf
+                    if slave_hitmap != 0:
+                        self.chip.pixels_cfg(0b11, [data.sec], [data.col], [data.corepr], [0], slave_hitmap)
 
-                master_hitmap = (data.hitmap >> 4) & 0xf
-                if master_hitmap != 0:
-                    self.chip.pixels_cfg(0b11, [data.sec], [data.col], [data.corepr], [1], master_hitmap)
+                    master_hitmap = (data.hitmap >> 4) & 0xf
+                    if master_hitmap != 0:
+                        self.chip.pixels_cfg(0b11, [data.sec], [data.col], [data.corepr], [1], master_hitmap)
 
-                pixels = data.get_pixels()
+                    pixels = data.get_pixels()
 
-                for pix in pixels:
-                    if not np.isnan(self.result[pix.row][pix.col]):
-                        seen_again += 1
-                        continue
+                    for pix in pixels:
+                        if not np.isnan(self.result[pix.row][pix.col]):
+                            seen_again += 1
+                            continue
 
-                    # First time we see this pixel. Mark its baseline and mask it
-                    self.result[pix.row][pix.col] = iteration
-                    masked += 1
+                        # First time we see this pixel. Mark its baseline and mask it
+                        self.result[pix.row][pix.col] = iteration
+                        masked += 1
 
-                self.logger.info("Masked @ %s" % data)
+                    self.logger.info("Masked @ %s" % data)
 
             masked_total += masked
             self.pbar.update(masked)
@@ -171,3 +172,9 @@ class BaselineScan(ScanTest):
 
     def deserialize(self, serialized):
         self.result = np.array(serialized)
+
+    def serialize_arrays(self):
+        return ({'result': self.result}, {})
+
+    def deserialize_arrays(self, arrays, attrs):
+        self.result = arrays['result']
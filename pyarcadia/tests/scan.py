@@ -1,9 +1,155 @@
 import time
 import threading
+import numpy as np
 from tqdm import tqdm
 
+from ..daq import Chip
+from ..data import Pixel
+from ..sequence import Sequence
+from ..recording import Replay
 from ..test import Test
 
+class ScanResult:
+    """Per-pixel results of a scan, stored as dense int32 arrays with a row
+    per pixel and a column per scan step, one for each field. Hits are
+    accumulated in bulk, through a (row, col) lookup table.
+
+    Steps are marked as measured when reset: the values of the steps not
+    measured yet read as NaN.
+
+    :param list[tuple] pixels: (row, col) of the pixels
+    :param int steps: Number of scan steps
+    :param list[str] fields: Results stored for each pixel and step
+
+    :ivar numpy.ndarray rows: Row of each pixel
+    :ivar numpy.ndarray cols: Column of each pixel
+    :ivar dict counts: Counts by field, shape (n_pixels, steps)
+    :ivar dict measured: Measured steps by field
+    """
+    def __init__(self, pixels, steps, fields):
+        pixels = np.array(list(dict.fromkeys(pixels)), dtype=np.int32).reshape(-1, 2)
+        self.rows = pixels[:, 0]
+        self.cols = pixels[:, 1]
+        self.steps = steps
+        self.fields = tuple(fields)
+
+        self.lookup = np.full((512, 512), -1, dtype=np.int32)
+        self.lookup[self.rows, self.cols] = np.arange(len(pixels), dtype=np.int32)
+
+        self.counts = {field: np.zeros((len(pixels), steps), dtype=np.int32) for field in self.fields}
+        self.measured = {field: np.zeros(steps, dtype=bool) for field in self.fields}
+
+        self._pixels = None
+        self._stale = True
+
+    @classmethod
+    def from_arrays(cls, pixels, arrays):
+        """Builds a ScanResult from per-pixel float arrays, as returned by
+        values. Steps are measured if any of the pixels has a value.
+
+        :param numpy.ndarray pixels: (row, col) of the pixels, shape (n_pixels, 2)
+        :param dict arrays: Values by field, shape (n_pixels, steps)
+        :rtype: ScanResult
+        """
+        arrays = {field: np.asarray(values, dtype=float) for field, values in arrays.items()}
+
+        # Without pixels, the number of steps can't be inferred
+        if len(pixels) == 0:
+            arrays = {field: values.reshape(0, values.shape[1] if values.ndim == 2 else 0) for field, values in arrays.items()}
+        else:
+            arrays = {field: values.reshape(len(pixels), -1) for field, values in arrays.items()}
+        steps = max((values.shape[1] for values in arrays.values()), default=0)
+
+        result = cls([tuple(pixel) for pixel in np.asarray(pixels).tolist()], steps, arrays)
+        for field, values in arrays.items():
+            measured = np.isfinite(values)
+            result.counts[field][:, :values.shape[1]] = np.where(measured, values, 0)
+            result.measured[field][:values.shape[1]] = measured.any(axis=0)
+
+        return result
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, pixel):
+        row, col = pixel
+        return 0 <= row < 512 and 0 <= col < 512 and self.lookup[row, col] >= 0
+
+    def index(self, pixels):
+        """Returns the index of the pixels in the arrays
+
+        :param list[tuple] pixels: (row, col) of the pixels
+        :returns: Indexes, -1 for the pixels not in the results
+        :rtype: numpy.ndarray
+        """
+        pixels = np.array(list(pixels), dtype=np.int32).reshape(-1, 2)
+        return self.lookup[pixels[:, 0], pixels[:, 1]]
+
+    def reset(self, field, step):
+        """Zeroes a step of a field, marking it as measured
+
+        :param str field: Field to reset
+        :param int step: Step to reset
+        """
+        self.counts[field][:, step] = 0
+        self.measured[field][step] = True
+        self._stale = True
+
+    def accumulate(self, field, step, rows, cols):
+        """Counts the hits of a step, one for each (row, col)
+
+        :param str field: Field to accumulate into
+        :param int step: Step to accumulate into
+        :param numpy.ndarray rows: Rows of the hits
+        :param numpy.ndarray cols: Columns of the hits
+        :returns: Rows and columns of the hits on pixels not in the results
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        idx = self.lookup[rows, cols]
+        known = idx >= 0
+
+        np.add.at(self.counts[field][:, step], idx[known], 1)
+        self._stale = True
+
+        return (rows[~known], cols[~known])
+
+    def values(self, field, idx=None):
+        """Returns the values of a field, NaN on the steps not measured
+
+        :param str field: Field to return
+        :param numpy.ndarray idx: Optional, index of the pixels to return. By default, all of them
+        :returns: Values, shape (n_pixels, steps)
+        :rtype: numpy.ndarray[float]
+        """
+        values = (self.counts[field] if idx is None else self.counts[field][idx]).astype(float)
+        values[:, ~self.measured[field]] = np.nan
+
+        return values
+
+    def pixels(self):
+        """Returns a Pixel for each of the pixels in the results, whose fields
+        are read-only views of the values. Pixels are created once, so that
+        other attributes can be stored in them, and their views are updated
+        when the results change.
+
+        :returns: Pixels by (row, col)
+        :rtype: dict
+        """
+        if self._pixels is None:
+            self._pixels = {(row, col): Pixel(row, col) for row, col in zip(self.rows.tolist(), self.cols.tolist())}
+
+        if self._stale:
+            for field in self.fields:
+                values = self.values(field)
+                values.flags.writeable = False
+
+                for pixel, row in zip(self._pixels.values(), values):
+                    setattr(pixel, field, row)
+
+            self._stale = False
+
+        return self._pixels
+
 class ParallelAnalysis(threading.Thread):
     test = None
 
@@ -111,6 +257,60 @@ class ScanTest(Test):
 
         self.elab_phases_run.append((popped[-1].message, popped[-1].payload))
 
+    def elab_other(self, subseq):
+        """Elaborates, while replaying, a SubSequence terminated by a CustomWord
+        which doesn't belong to any phase
+        """
+        self.logger.info("Skipping SubSequence terminated by %s", subseq[-1])
+
+    def replay(self, source, chunk=32768, speed=None):
+        """Elaborates saved packets offline, as loop() elaborates the packets
+        read from the chip. SubSequences terminated by the CustomWord of a phase
+        are passed to its elaboration, the others to elab_other. The GCRs and
+        the timestamp resolution are taken from the recording, if known.
+
+        :param source: Replay, or packets to replay, see recording.Replay
+        :param int chunk: Maximum number of packets read at once
+        :param float speed: Optional, replay speed w.r.t. real time. By default, as fast as possible
+        :returns: Number of SubSequences elaborated by the phases
+        :rtype: int
+        """
+        replay = source if isinstance(source, Replay) else Replay(source, chunk=chunk, speed=speed)
+
+        if replay.ts_us is not None:
+            Chip.ts_us = replay.ts_us
+
+        if replay.gcrs is not None:
+            self.gcrs = replay.gcrs
+
+        # The replay stands in for the chip, e.g. for filter_double_injections
+        self.sequence = Sequence(chip=replay, columnar=self.sequence.columnar)
+        self.elab_phases_run = []
+
+        replay.packets_read_start()
+        while not replay.exhausted():
+            packets = replay.packets_read()
+            if len(packets) == 0:
+                time.sleep(1E-3)
+                continue
+
+            self.sequence.elaborate_auto(packets)
+
+            while len(self.sequence) > 0 and self.sequence[0].is_complete():
+                popped = self.sequence.pop(0, log=self.log)
+                message = popped[-1].message
+
+                if message not in self.phases:
+                    self.elab_other(popped)
+                    continue
+
+                self.phases[message][1](popped)
+                self.elab_phases_run.append((message, popped[-1].payload))
+
+        replay.packets_read_stop()
+
+        return len(self.elab_phases_run)
+
     def _start_analysis_thread(self):
         if self.analysis_thread is not None and self.analysis_thread.is_alive():
             self.logger.warning("Analysis thread was alive, waiting for it to end...")
@@ -1,16 +1,217 @@
 import math
 import time
+import concurrent.futures
 import numpy as np
-import scipy.optimize
-import scipy.special
-from matplotlib import pyplot as plt, cm, colors, ticker
 
 from ..daq import Chip
-from ..data import CustomWord, Pixel, FPGAData
-from .scan import ScanTest
+from ..data import CustomWord, Pixel, FPGAData, TAG_FALLING_EDGE, expand_pixels
+from ..sequence import worker_context
+from .scan import ScanTest, ScanResult
+
+# Maximum pixels fitted together by ThresholdScan.scurve_fit, to bound memory usage
+FIT_CHUNK = 4096
+
+def fit_scurves(x, y, max_iterations=100, ftol=1.49012e-08, xtol=1.49012e-08):
+    """Fits an s-curve, as ThresholdScan._fit, to each row of y at once with
+    a vectorized Levenberg-Marquardt. The fits start from the moments of the
+    curves derivatives. NaN points are left out of the fits.
+
+    Errors are estimated as scipy.optimize.curve_fit does. Fits that do not
+    converge, have no more points than parameters or are steeper than the
+    points spacing, are flagged so that they can be retried one by one.
+
+    :param numpy.ndarray x: Points, shape (n_points,)
+    :param numpy.ndarray y: Curves to fit, shape (n_curves, n_points)
+    :param int max_iterations: Maximum number of iterations
+    :param float ftol: Relative tolerance on the sum of squares
+    :param float xtol: Relative tolerance on the parameters
+    :returns: mu, sigma, their errors and covariance, and the converged flags
+    :rtype: tuple(numpy.ndarray)
+    """
+    import scipy.special
+
+    x = np.asarray(x, dtype=float)
+    y = np.array(y, dtype=float, ndmin=2)
+    valid = np.isfinite(y)
+    y[~valid] = 0
+    points = valid.sum(axis=1)
+
+    # Derivatives between consecutive valid points
+    last = np.maximum.accumulate(np.where(valid, np.arange(len(x)), 0), axis=1)
+    filled = np.take_along_axis(y, last, axis=1)
+    dy = np.diff(np.where(np.maximum.accumulate(valid, axis=1), filled, np.nan), axis=1)
+    dy[np.isnan(dy)] = 0
+    mid = (x[1:] + x[:-1])/2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = dy.sum(axis=1)
+        mu = (dy*mid).sum(axis=1)/step
+        var = (dy*(mid - mu[:, None])**2).sum(axis=1)/step
+        sigma = np.sign(step)*np.sqrt(np.maximum(np.abs(var), 0.25*np.min(np.diff(x), initial=1)**2))
+
+    active = np.flatnonzero(np.isfinite(mu) & np.isfinite(sigma) & (sigma != 0) & (points > 2))
+    converged = np.zeros(len(y), dtype=bool)
+    damping = np.full(len(y), 1E-3)
+
+    def evaluate(idx, mu, sigma):
+        z = (x - mu[:, None])/sigma[:, None]
+        gauss = np.exp(-0.5*z**2)/(np.sqrt(2*np.pi)*sigma[:, None])*valid[idx]
+        residuals = (y[idx] - 0.5*(1 + scipy.special.erf(z/np.sqrt(2))))*valid[idx]
+        # Jacobian of the model w.r.t. mu and sigma
+        j_mu = -gauss
+        j_sigma = -gauss*z
+        return (residuals, j_mu, j_sigma, (residuals**2).sum(axis=1))
+
+    for _ in range(max_iterations):
+        if len(active) == 0:
+            break
+
+        residuals, j_mu, j_sigma, ssr = evaluate(active, mu[active], sigma[active])
+        a = (j_mu**2).sum(axis=1)
+        b = (j_mu*j_sigma).sum(axis=1)
+        c = (j_sigma**2).sum(axis=1)
+        g_mu = (j_mu*residuals).sum(axis=1)
+        g_sigma = (j_sigma*residuals).sum(axis=1)
+
+        lam = damping[active]
+        da, dc = a*(1 + lam), c*(1 + lam)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            det = da*dc - b**2
+            d_mu = (dc*g_mu - b*g_sigma)/det
+            d_sigma = (da*g_sigma - b*g_mu)/det
+
+        new_mu = mu[active] + d_mu
+        new_sigma = sigma[active] + d_sigma
+        new_ssr = evaluate(active, new_mu, new_sigma)[3]
+
+        accepted = np.isfinite(new_ssr) & (new_ssr <= ssr) & (new_sigma != 0)
+        better = active[accepted]
+        mu[better] = new_mu[accepted]
+        sigma[better] = new_sigma[accepted]
+        damping[better] /= 10
+        damping[active[~accepted]] *= 10
+
+        done = accepted & (
+            (ssr - new_ssr <= ftol*ssr) |
+            ((np.abs(d_mu) <= xtol*(np.abs(new_mu) + xtol)) & (np.abs(d_sigma) <= xtol*(np.abs(new_sigma) + xtol))))
+        converged[active[done]] = True
+
+        # Give up on fits that cannot improve anymore
+        active = active[~done & (damping[active] < 1E10)]
+
+    # Covariance at the solution, scaled by the residual variance
+    mu_err = np.full(len(y), np.inf)
+    sigma_err = np.full(len(y), np.inf)
+    covariance = np.full(len(y), np.inf)
+
+    idx = np.flatnonzero(converged)
+    if len(idx) > 0:
+        residuals, j_mu, j_sigma, ssr = evaluate(idx, mu[idx], sigma[idx])
+        a = (j_mu**2).sum(axis=1)
+        b = (j_mu*j_sigma).sum(axis=1)
+        c = (j_sigma**2).sum(axis=1)
+        scale = ssr/(points[idx] - 2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            det = a*c - b**2
+            mu_var = c/det*scale
+            sigma_var = a/det*scale
+            cov = -b/det*scale
+
+        # Steps sharper than the points spacing are not constrained
+        singular = ~(det > 0) | (np.abs(sigma[idx]) < 0.1*np.min(np.diff(x), initial=1))
+        converged[idx[singular]] = False
+
+        mu_err[idx] = np.sqrt(mu_var)
+        sigma_err[idx] = np.sqrt(sigma_var)
+        covariance[idx] = cov
+
+    mu[~converged] = np.nan
+    sigma[~converged] = np.nan
+    mu_err[~converged] = np.inf
+    sigma_err[~converged] = np.inf
+    covariance[~converged] = np.inf
+
+    return (mu, sigma, mu_err, sigma_err, covariance, converged)
+
+def saturation_points(saturation):
+    """Saturation hits of each pixel, normalized to the ones at the highest
+    VCASN
+
+    :param numpy.ndarray saturation: Saturation hits, shape (n_pixels, n_vcasn)
+    :returns: Points to fit
+    :rtype: numpy.ndarray
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = saturation/saturation[:, -1:]
+
+    # NaNs count as saturated, as min(1, nan) does
+    return np.where(normalized < 1, normalized, 1)
+
+def _curve_fit(x, y):
+    import scipy.optimize
+
+    valid = np.isfinite(y)
+
+    try:
+        return scipy.optimize.curve_fit(ThresholdScan._fit, list(x[valid]), list(y[valid]))
+    except (RuntimeError, ValueError, TypeError):
+        return None
+
+def fit_baseline(x, saturation):
+    """Finds the baseline of a pixel, as the VCASN at which it gets half of
+    its saturation hits. If the fit fails, the first VCASN with 10% of them.
+
+    :param numpy.ndarray x: VCASN points
+    :param numpy.ndarray saturation: Saturation hits at each point
+    :returns: Baseline and its error
+    :rtype: tuple(float, float)
+    """
+    if saturation[-1] == 0:
+        return (np.nan, np.nan)
+
+    points = saturation_points(saturation[None, :])[0]
+
+    fit = _curve_fit(x, points)
+    if fit is None:
+        above = np.flatnonzero(saturation >= 0.1*max(points))
+        return (x[above[0]], 10) if len(above) > 0 else (np.nan, np.nan)
+
+    s_opt, s_cov = fit
+    return (s_opt[0], np.amax(s_cov))
+
+def fit_pixels(x, data, saturation):
+    """Fits the s-curves and the baselines of a set of pixels, as
+    ThresholdScan.scurve_fit does. Runs in the worker processes.
+
+    :param numpy.ndarray x: VCASN points
+    :param numpy.ndarray data: Points of the s-curves, shape (n_pixels, n_vcasn)
+    :param numpy.ndarray saturation: Saturation hits, shape (n_pixels, n_vcasn)
+    :returns: mu, sigma, their errors, baseline and its error. mu is NaN where the fit failed
+    :rtype: tuple(numpy.ndarray)
+    """
+    mu, sigma, mu_err, sigma_err, _, converged = fit_scurves(x, data)
+
+    # Slow path for the fits which did not converge
+    for i in np.flatnonzero(~converged):
+        fit = _curve_fit(x, data[i])
+        if fit is not None:
+            mu[i], sigma[i] = fit[0]
+            mu_err[i], sigma_err[i] = np.sqrt(np.diag(fit[1]))
+
+    baseline, _, b_mu_err, b_sigma_err, b_cov, b_converged = fit_scurves(x, saturation_points(saturation))
+    baseline_err = np.fmax(np.fmax(b_mu_err**2, b_sigma_err**2), b_cov)
+
+    for i in np.flatnonzero(~b_converged & ~np.isnan(mu)):
+        baseline[i], baseline_err[i] = fit_baseline(x, saturation[i])
+
+    empty = saturation[:, -1] == 0
+    baseline[empty] = np.nan
+    baseline_err[empty] = np.nan
+
+    return (mu, sigma, mu_err, sigma_err, baseline, baseline_err)
 
 class ThresholdScan(ScanTest):
-    pixels = {}
     th = 1
     sections = []
     axes = ["VCASN (#)", "Hits (#)"]
@@ -19,9 +220,14 @@ class ThresholdScan(ScanTest):
     tp_on = 10
     tp_off = 10
 
+    fields = ('injected_hits', 'injected_fe_hits', 'noise_hits', 'saturation_hits')
+
     def __init__(self, log=False):
         super().__init__()
 
+        self.result = None
+        self._pixels = {}
+
         self.title = 'Threshold Scan'
         self.log = log
 
@@ -38,6 +244,42 @@ class ThresholdScan(ScanTest):
             0xCAFECAFE : [self.ctrl_phase4, self.elab_phase4]
         }
 
+    @property
+    def pixels(self):
+        """Scanned pixels by (row, col). Their hits are read-only views of
+        the ScanResult, if any, see ScanResult.pixels.
+
+        :rtype: dict
+        """
+        if self.result is not None:
+            return self.result.pixels()
+
+        return self._pixels
+
+    @pixels.setter
+    def pixels(self, pixels):
+        # Plain Pixels, e.g. merged from other scans, replace the results
+        self.result = None
+        self._pixels = pixels
+
+    def _hits(self, field, pixels):
+        """Returns the hits of some pixels, as an array
+
+        :param str field: Hits to return
+        :param list[tuple] pixels: (row, col) of the pixels
+        :returns: Hits, NaN if not measured, shape (n_pixels, n_vcasn)
+        :rtype: numpy.ndarray
+        :raises KeyError: If some of the pixels were not scanned
+        """
+        if self.result is not None:
+            idx = self.result.index(pixels)
+            if np.any(idx < 0):
+                raise KeyError("Pixels not in the results: %s" % [pix for pix, i in zip(pixels, idx) if i < 0])
+
+            return self.result.values(field, idx)
+
+        return np.array([getattr(self.pixels[pix], field) for pix in pixels], dtype=float).reshape(len(pixels), -1)
+
     def pre_main(self):
         super().pre_main()
 
@@ -58,31 +300,7 @@ class ThresholdScan(ScanTest):
             if test[-1] == CustomWord(message=0xDEADDEAD):
                 break
 
-        self.pixels = {}
-
-        per_sec = [0] * 16
-
-        print("Starting scan on the following pixels: [", end="")
-        counter = 0
-        for packet in test.get_data():
-            per_sec[packet.ser] += 1
-
-            for p in packet.get_pixels():
-                p.injected_hits = [np.nan for _ in self.range]
-                p.injected_fe_hits = [np.nan for _ in self.range]
-                p.noise_hits = [np.nan for _ in self.range]
-                p.saturation_hits = [np.nan for _ in self.range]
-                self.pixels[(p.row, p.col)] = p
-                print("(%d, %d)" % (p.row, p.col), end="")
-                counter += 1
-
-            if packet.sec not in self.sections:
-                self.sections.append(packet.sec)
-
-        print("]\nFor a total of %d pixels" % counter)
-
-        if counter == 0:
-            raise ValueError("No pixels have been selected!")
+        per_sec = self.select_pixels(test)
 
         ts_tp = test.get_tps()[0].ts
         ts_data = test.get_data()[-1].ts_fpga
@@ -100,6 +318,42 @@ class ThresholdScan(ScanTest):
         FPGAData.packets_count = 0
         self.chip.fifo_overflow_counter_reset()
 
+    def select_pixels(self, subseq):
+        """Selects the pixels to scan, as the ones hit by the Test Pulse
+        preceding the scan
+
+        :param SubSequence subseq: Packets of the Test Pulse
+        :returns: Data packets per lane
+        :rtype: list[int]
+        :raises ValueError: If no pixels have been hit
+        """
+        table = subseq.get_data_table()
+        per_sec = np.bincount(table['ser'], minlength=16).tolist()
+
+        rows, cols, _ = expand_pixels(table)
+        pixels = list(zip(rows.tolist(), cols.tolist()))
+        counter = len(pixels)
+
+        print("Starting scan on the following pixels: [%s]" % "".join("(%d, %d)" % pixel for pixel in pixels))
+        print("For a total of %d pixels" % counter)
+
+        for sec in dict.fromkeys(table['sec'].tolist()):
+            if sec not in self.sections:
+                self.sections.append(sec)
+
+        if counter == 0:
+            raise ValueError("No pixels have been selected!")
+
+        self.result = ScanResult(pixels, len(self.range), self.fields)
+        return per_sec
+
+    def elab_other(self, subseq):
+        if subseq[-1] == CustomWord(message=0xDEADDEAD):
+            self.select_pixels(subseq)
+            return
+
+        super().elab_other(subseq)
+
     def post_main(self):
         self.sequence.autoread = False
 
@@ -145,139 +399,130 @@ class ThresholdScan(ScanTest):
         pass
 
     def elab_phase1(self, subseq):
-        dig_injs_data = subseq.get_data()
+        dig_injs_data = subseq.get_data_table()
         self.packets_count += len(dig_injs_data)
         dig_injs_tps = subseq.get_tps()
 
         tps = len(dig_injs_tps)
+        per_sec = np.bincount(dig_injs_data['sec'], minlength=16)
 
         for section in self.sections:
-            packets = list(filter(lambda x: x.sec == section, dig_injs_data))
+            if per_sec[section] < tps:
+                self.logger.warning("Section %d returned %d tps instead of %d", section, per_sec[section], tps)
 
-            if len(packets) < tps:
-                self.logger.warning("Section %d returned %d tps instead of %d", section, len(packets), tps)
+    def _count_hits(self, field, th, rows, cols):
+        rows, cols = self.result.accumulate(field, th, rows, cols)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            self.logger.info("Unexpected pixel in this run: %s", Pixel(row, col))
 
     def elab_phase2(self, subseq):
-        analog_hits_tps = subseq.get_tps()
-        tps = len(analog_hits_tps)
         th = subseq[-1].payload
-        data = subseq.get_data()
+        table = subseq.get_data_table()
 
-        for pixel in self.pixels:
-            self.pixels[pixel].injected_fe_hits[th] = 0
-            self.pixels[pixel].injected_hits[th] = 0
-
-        self.packets_count += len(data)
-        subseq.filter_double_injections()
-        for packet in data:
-            for pix in packet.get_pixels():
-                if (pix.row, pix.col) not in self.pixels:
-                    self.logger.info("Unexpected pixel in this run: %s", pix)
-                else:
-                    if packet.tag == 'falling edge':
-                        self.pixels[(pix.row, pix.col)].injected_fe_hits[th] += 1
-                    else:
-                        self.pixels[(pix.row, pix.col)].injected_hits[th] += 1
+        self.result.reset('injected_hits', th)
+        self.result.reset('injected_fe_hits', th)
+
+        self.packets_count += len(table)
+        tags = subseq.filter_double_injections()
+        rows, cols, packet_idx = expand_pixels(table)
+
+        falling = tags[packet_idx] == TAG_FALLING_EDGE
+        self._count_hits('injected_fe_hits', th, rows[falling], cols[falling])
+        self._count_hits('injected_hits', th, rows[~falling], cols[~falling])
 
     def elab_phase3(self, subseq):
-        noisy_hits_data = subseq.get_data()
-        self.packets_count += len(noisy_hits_data)
         th = subseq[-1].payload
+        table = subseq.get_data_table()
+        self.packets_count += len(table)
 
-        for pixel in self.pixels:
-            self.pixels[pixel].noise_hits[th] = 0
-
-        for p in noisy_hits_data:
-            for pix in p.get_pixels():
-                try:
-                    self.pixels[(pix.row, pix.col)].noise_hits[th] += 1
-                except KeyError:
-                    self.logger.info("Unexpected pixel in this run: %s", pix)
+        self.result.reset('noise_hits', th)
+        rows, cols, _ = expand_pixels(table)
+        self._count_hits('noise_hits', th, rows, cols)
 
     def elab_phase4(self, subseq):
-        noisy_hits_data = subseq.get_data()
-        self.packets_count += len(noisy_hits_data)
         th = subseq[-1].payload
+        table = subseq.get_data_table()
+        self.packets_count += len(table)
 
-        for pixel in self.pixels:
-            self.pixels[pixel].saturation_hits[th] = 0
-
-        for p in noisy_hits_data:
-            for pix in p.get_pixels():
-                try:
-                    self.pixels[(pix.row, pix.col)].saturation_hits[th] += 1
-                except KeyError:
-                    self.logger.info("Unexpected pixel in this run: %s", pix)
+        self.result.reset('saturation_hits', th)
+        rows, cols, _ = expand_pixels(table)
+        self._count_hits('saturation_hits', th, rows, cols)
 
     @staticmethod
     def _fit_inverse(x, mu, sigma):
+        import scipy.special
+
         return mu + sigma*np.sqrt(2)*scipy.special.erfi(2*x - 1)
 
     @staticmethod
     def _fit(x, mu, sigma):
+        import scipy.special
+
         return 0.5*(1+scipy.special.erf((x-mu)/(sigma*np.sqrt(2))))
 
     def find_baseline(self, pix, show=False):
         if pix not in self.pixels:
             return None
 
-        pixel = self.pixels[pix]
-
-        """
-        avg = 0
-        total = 0
-        for vcasn in self.range:
-            avg += vcasn * pixel.noise_hits[vcasn]
-            total += pixel.noise_hits[vcasn]
-
-        if total > 0:
-            avg = avg/total
-            return avg
-        """
+        return fit_baseline(np.array(self.range), self._hits('saturation_hits', [pix])[0])
 
-        saturation_top = pixel.saturation_hits[-1]
-        if saturation_top == 0:
-            return (np.nan, np.nan)
+    def _scurve_points(self, injected, saturation):
+        """Fraction of the Test Pulses detected by each pixel at each VCASN.
+        Points with too many saturation hits are considered saturated.
 
-        saturation = [min(1, i/saturation_top) for i in pixel.saturation_hits]
+        :param numpy.ndarray injected: Injected hits, shape (n_pixels, n_vcasn)
+        :param numpy.ndarray saturation: Saturation hits, shape (n_pixels, n_vcasn)
+        :returns: Points to fit, NaN where missing
+        :rtype: numpy.ndarray
+        """
+        with np.errstate(invalid='ignore'):
+            data = np.where(saturation <= self.injections/4, np.minimum(injected/self.injections, 1), 1)
 
-        skip = False
-        try:
-            s_opt, s_cov = scipy.optimize.curve_fit(self._fit, list(self.range), saturation)
-            err = np.amax(s_cov)
-        except (RuntimeError, ValueError):
-            skip = True
+        data[~np.isfinite(injected/self.injections)] = np.nan
+        return data
 
-        if skip:# or err > 10:
-            threshold = 0.1*max(saturation)
-            for vcasn in self.range:
-                if pixel.saturation_hits[vcasn] >= threshold:
-                    return (vcasn, 10)
+    def scurve_fit(self, pixels=None, workers=1):
+        """Fits the s-curves of the pixels, and computes their baseline, gain
+        and noise. Pixels are fitted all at once (see fit_scurves), in chunks
+        which can be spread over worker processes. The fits that do not
+        converge are retried one by one.
 
-        return (self._fit_inverse(0.5, s_opt[0], s_opt[1]), err)
+        Worker processes are not forked, as threads may be running, but
+        started anew: as with any multiprocessing start method other than
+        fork, the calling script must be guarded by
+        ``if __name__ == '__main__':``.
 
-    def scurve_fit(self, pixels=None):
+        :param list pixels: Optional, pixels to fit. By default, all of them
+        :param int workers: Optional, number of worker processes. 1 fits in this process
+        """
         if pixels is None:
             pixels = list(self.pixels.keys())
 
-        for pixel_idx in pixels:
-            pixel = self.pixels[pixel_idx]
+        pixels = list(pixels)
+        if len(pixels) == 0:
+            return
 
-            points = []
-            data = []
-            for vcasn in self.range:
-                if math.isnan(pixel.injected_hits[vcasn]):
-                    continue
+        x = np.array(self.range, dtype=float)
+        injected = self._hits('injected_hits', pixels)
+        saturation = self._hits('saturation_hits', pixels)
+        data = self._scurve_points(injected, saturation)
+
+        size = min(FIT_CHUNK, math.ceil(len(pixels)/max(1, workers)))
+        starts = range(0, len(pixels), size)
+        chunks = ([x]*len(starts), [data[i:i+size] for i in starts], [saturation[i:i+size] for i in starts])
 
-                tmp = min(pixel.injected_hits[vcasn]/self.injections, 1) if pixel.saturation_hits[vcasn] <= self.injections/4 else 1
+        if workers > 1 and len(starts) > 1:
+            with concurrent.futures.ProcessPoolExecutor(min(workers, len(starts)), mp_context=worker_context()) as executor:
+                fits = list(executor.map(fit_pixels, *chunks))
+        else:
+            fits = list(map(fit_pixels, *chunks))
 
-                if not math.isnan(tmp) and not math.isinf(tmp):
-                    points.append(vcasn)
-                    data.append(tmp)
+        mu, sigma, mu_err, sigma_err, baseline, baseline_err = [np.concatenate(arrays) for arrays in zip(*fits)]
+
+        for i, pixel_idx in enumerate(pixels):
+            pixel = self.pixels[pixel_idx]
 
-            try:
-                s_opt, s_cov = scipy.optimize.curve_fit(self._fit, points, data)
-            except (RuntimeError, ValueError):
+            if np.isnan(mu[i]):
                 pixel.baseline = np.nan
                 pixel.baseline_err = np.nan
                 pixel.gain = np.nan
@@ -291,24 +536,25 @@ class ThresholdScan(ScanTest):
                 pixel.fit_sigma_err = np.inf
                 continue
 
-            stderrs = np.sqrt(np.diag(s_cov))
-
             vcal_hi = self.gcrs['BIAS{}_VCAL_HI'.format(pixel.get_sec())]
             vcal_lo = self.gcrs['BIAS{}_VCAL_LO'.format(pixel.get_sec())]
             q_in = ((595+35*vcal_hi)-(560*vcal_lo))*1.1625/1000
 
-            (pixel.baseline, pixel.baseline_err) = [5*i for i in self.find_baseline(pixel_idx)] # mV
-            pixel.gain = 5*(pixel.baseline - s_opt[0])/q_in # mV/fC
-            pixel.gain_err = 5*stderrs[0]/q_in # mV/fC assuming error-free baseline
-            pixel.noise = 5*s_opt[1] # mV
-            pixel.noise_err = 5*stderrs[1] # mV
+            pixel.baseline = 5*baseline[i] # mV
+            pixel.baseline_err = 5*baseline_err[i] # mV
+            pixel.gain = 5*(pixel.baseline - mu[i])/q_in # mV/fC
+            pixel.gain_err = 5*mu_err[i]/q_in # mV/fC assuming error-free baseline
+            pixel.noise = 5*sigma[i] # mV
+            pixel.noise_err = 5*sigma_err[i] # mV
 
-            pixel.fit_mu = s_opt[0]
-            pixel.fit_mu_err = stderrs[0]
-            pixel.fit_sigma = s_opt[1]
-            pixel.fit_sigma_err = stderrs[1]
+            pixel.fit_mu = mu[i]
+            pixel.fit_mu_err = mu_err[i]
+            pixel.fit_sigma = sigma[i]
+            pixel.fit_sigma_err = sigma_err[i]
 
     def _plot_points(self, fig, ax, **kwargs):
+        from matplotlib import ticker
+
         inj = self.pixels[kwargs['pix']].injected_hits
         ax.plot(self.range, inj, '--bo', label='Test Pulse hits')
 
@@ -333,6 +579,8 @@ class ThresholdScan(ScanTest):
         ax.set_ylabel('Hits')
 
     def plot_single(self, show=True, saveas=None, pix=None, notes=None):
+        from matplotlib import pyplot as plt
+
         if pix is None or pix not in self.pixels:
             return
 
@@ -381,7 +629,9 @@ class ThresholdScan(ScanTest):
 
         return (xes, yes)
 
-    def plot_heatmaps(self, show=True, saveas=None, notes=None, pixels=None, cutoff=5):
+    def plot_heatmaps(self, show=True, saveas=None, notes=None, pixels=None, cutoff=5, workers=1):
+        from matplotlib import pyplot as plt, ticker
+
         pixels = self.pixels.keys() if pixels is None else pixels
         xes, yes = self._tight_axes(pixels)
 
@@ -392,22 +642,28 @@ class ThresholdScan(ScanTest):
         hm_noise = np.full((len(yes), len(xes)), np.nan)
         hm_noise_err = np.full((len(yes), len(xes)), np.nan)
 
+        unfitted = [pix for pix in pixels if 'baseline' not in self.pixels[pix].__dict__]
+        if len(unfitted) > 0:
+            self.scurve_fit(unfitted, workers)
+
+        rows = {y: i for i, y in enumerate(yes)}
+        cols = {x: i for i, x in enumerate(xes)}
+
         skipped = []
         for pix in pixels:
             p = self.pixels[pix]
-            if 'baseline' not in p.__dict__:
-                self.scurve_fit([pix])
 
             if p.fit_mu_err > cutoff or p.fit_sigma_err > cutoff:
                 skipped.append(pix)
                 continue
 
-            hm_baseline[yes.index(pix[0]), xes.index(pix[1])] = p.baseline
-            hm_baseline_err[yes.index(pix[0]), xes.index(pix[1])] = p.baseline_err
-            hm_gain[yes.index(pix[0]), xes.index(pix[1])] = p.gain
-            hm_gain_err[yes.index(pix[0]), xes.index(pix[1])] = p.gain_err
-            hm_noise[yes.index(pix[0]), xes.index(pix[1])] = p.noise
-            hm_noise_err[yes.index(pix[0]), xes.index(pix[1])] = p.noise_err
+            idx = (rows[pix[0]], cols[pix[1]])
+            hm_baseline[idx] = p.baseline
+            hm_baseline_err[idx] = p.baseline_err
+            hm_gain[idx] = p.gain
+            hm_gain_err[idx] = p.gain_err
+            hm_noise[idx] = p.noise
+            hm_noise_err[idx] = p.noise_err
 
         if len(skipped) > 0:
             print("Skipped the following pixels with errors > %d: %s" % (cutoff, skipped))
@@ -463,6 +719,8 @@ class ThresholdScan(ScanTest):
         self._plot_footer(fig, show, saveas, 'Noise map', notes, saveas_append="_noise")
 
     def plot_histograms(self, show=True, saveas=None, notes=None, sections=None, cutoff=5):
+        from matplotlib import pyplot as plt
+
         sections = list(range(16)) if sections is None else sections
         if isinstance(sections, int):
             sections = [sections]
@@ -512,10 +770,10 @@ class ThresholdScan(ScanTest):
             tmp = []
             tmp.append(pixel[0])
             tmp.append(pixel[1])
-            tmp.append(self.pixels[pixel].injected_hits)
-            tmp.append(self.pixels[pixel].noise_hits)
-            tmp.append(self.pixels[pixel].saturation_hits)
-            tmp.append(self.pixels[pixel].injected_fe_hits)
+            tmp.append(list(self.pixels[pixel].injected_hits))
+            tmp.append(list(self.pixels[pixel].noise_hits))
+            tmp.append(list(self.pixels[pixel].saturation_hits))
+            tmp.append(list(self.pixels[pixel].injected_fe_hits))
 
             listed.append(tmp)
 
@@ -524,11 +782,23 @@ class ThresholdScan(ScanTest):
     def deserialize(self, serialized):
         self.injections = serialized.pop(0)
 
-        for line in serialized:
-            p = Pixel(line[0], line[1])
-            p.injected_hits = line[2]
-            p.noise_hits = line[3]
-            p.saturation_hits = line[4]
-            p.injected_fe_hits = line[5]
+        # Same order as serialize
+        fields = ('injected_hits', 'noise_hits', 'saturation_hits', 'injected_fe_hits')
+        pixels = [(line[0], line[1]) for line in serialized]
+        arrays = {field: [line[2+i] for line in serialized] for i, field in enumerate(fields)}
+
+        self.result = ScanResult.from_arrays(pixels, arrays)
+
+    def serialize_arrays(self):
+        pixels = list(self.pixels)
+
+        arrays = {'pixels': np.array(pixels, dtype=np.int16).reshape(-1, 2)}
+        for field in self.fields:
+            arrays[field] = self._hits(field, pixels)
+
+        return (arrays, {'injections': self.injections})
+
+    def deserialize_arrays(self, arrays, attrs):
+        self.injections = attrs['injections']
 
-            self.pixels[(line[0], line[1])] = p
+        self.result = ScanResult.from_arrays(arrays['pixels'], {field: arrays[field] for field in self.fields})
@@ -3,6 +3,7 @@
 #include <unistd.h>
 #include <stdexcept>
 #include <chrono>
+#include <algorithm>
 
 #include <boost/property_tree/ptree.hpp>
 #include <boost/property_tree/ini_parser.hpp>
@@ -19,6 +20,126 @@
 
 #define SPI_CLOCK_DIV 7
 
+#define RECORDING_MAGIC   "ARCADIAR"
+#define RECORDING_VERSION 1
+
+/*
+ * Packets Ring Buffer
+ */
+PacketRing::PacketRing(size_t min_capacity) {
+	size_t capacity = 1;
+	while (capacity < min_capacity)
+		capacity <<= 1;
+
+	buffer = std::vector<uint64_t>(capacity);
+	mask = capacity-1;
+
+	head = 0;
+	tail = 0;
+}
+
+size_t PacketRing::size() const {
+	return head.load(std::memory_order_acquire) - tail.load(std::memory_order_acquire);
+}
+
+size_t PacketRing::available() const {
+	return capacity() - size();
+}
+
+void PacketRing::write(size_t offset, uint64_t packet) {
+	buffer[(head.load(std::memory_order_relaxed) + offset) & mask] = packet;
+}
+
+void PacketRing::commit(size_t count) {
+	head.store(head.load(std::memory_order_relaxed) + count, std::memory_order_release);
+}
+
+size_t PacketRing::pop(std::vector<uint64_t>* packets, size_t max_packets) {
+	size_t t = tail.load(std::memory_order_relaxed);
+	size_t h = head.load(std::memory_order_acquire);
+
+	size_t count = h - t;
+	if (max_packets && count > max_packets)
+		count = max_packets;
+
+	// Copy out, in two slices if wrapping around
+	size_t start = t & mask;
+	size_t first = std::min(count, capacity() - start);
+
+	packets->resize(count);
+	std::copy(buffer.begin() + start, buffer.begin() + start + first, packets->begin());
+	std::copy(buffer.begin(), buffer.begin() + (count - first), packets->begin() + first);
+
+	tail.store(t + count, std::memory_order_release);
+
+	return count;
+}
+
+void PacketRing::clear() {
+	tail.store(head.load(std::memory_order_acquire), std::memory_order_release);
+}
+
+
+/*
+ * FIFO reader statistics
+ */
+void FifoStats::reset() {
+	loop_iterations = 0;
+	empty_polls = 0;
+	blocks_read = 0;
+	packets_read = 0;
+	bytes_read = 0;
+	short_reads = 0;
+	max_occupancy = 0;
+	max_packets_stalls = 0;
+	ring_full_stalls = 0;
+	dispatches = 0;
+	dispatch_time_us = 0;
+
+	for (auto& bucket: dispatch_latency)
+		bucket = 0;
+}
+
+void FifoStats::record_dispatch(uint64_t latency_us) {
+	size_t bucket = 0;
+	while (bucket < latency_buckets-1 && (1ull << bucket) <= latency_us)
+		bucket++;
+
+	dispatches++;
+	dispatch_time_us += latency_us;
+	dispatch_latency[bucket]++;
+}
+
+void FifoStats::record_occupancy(uint64_t occupancy) {
+	uint64_t seen = max_occupancy.load(std::memory_order_relaxed);
+	while (occupancy > seen && !max_occupancy.compare_exchange_weak(seen, occupancy, std::memory_order_relaxed));
+}
+
+std::map<std::string, uint64_t> FifoStats::counters() const {
+	return {
+		{"loop_iterations",    loop_iterations},
+		{"empty_polls",        empty_polls},
+		{"blocks_read",        blocks_read},
+		{"packets_read",       packets_read},
+		{"bytes_read",         bytes_read},
+		{"short_reads",        short_reads},
+		{"max_occupancy",      max_occupancy},
+		{"max_packets_stalls", max_packets_stalls},
+		{"ring_full_stalls",   ring_full_stalls},
+		{"dispatches",         dispatches},
+		{"dispatch_time_us",   dispatch_time_us}
+	};
+}
+
+std::vector<uint64_t> FifoStats::latency_histogram() const {
+	std::vector<uint64_t> histogram(latency_buckets);
+	for (size_t bucket = 0; bucket < latency_buckets; bucket++)
+		histogram[bucket] = dispatch_latency[bucket];
+
+	return histogram;
+}
+
+
 /*
  * Chip Class
  */
@@ -30,11 +151,22 @@ ChipIf::ChipIf(uint8_t id, FPGAIf* fpga_ptr) {
 	fpga = fpga_ptr;
 
 	max_packets = 12.5E6;
+	ring_size = 0;
+	pipelined_read = false;
+	spi_transaction = false;
+	spi_poll_reads = 4;
+	gcr_write_changed_only = false;
+	gcr_writes_suppressed = 0;
+	fifo_pending = 0;
+	stop_after = 0;
 	run_flag = false;
 	daq_timeout = false;
 	spi_unavailable = false;
+	record_flag = false;
+	packets_recorded = 0;
 
 	GCR_address_array = std::vector<uint16_t>(calc_gcr_max_addr());
+	GCR_valid = std::vector<bool>(calc_gcr_max_addr(), false);
 	ctrl_address_array = std::vector<uint32_t>(calc_cmd_max_addr());
 
 	// init register array with default values
@@ -47,35 +179,60 @@ ChipIf::ChipIf(uint8_t id, FPGAIf* fpga_ptr) {
 
 	timeout = 0;
 	idle_timeout = 0;
+
+	resolve_nodes();
+}
+
+void ChipIf::resolve_nodes() {
+	const std::string id = std::to_string(chip_id);
+	uhal::HwInterface& lHW = fpga->lHW;
+
+	node_spi_ctrl          = &lHW.getNode("spi_id" + id + ".CTRL");
+	node_spi_txrx          = &lHW.getNode("spi_id" + id + ".TxRx0");
+	node_controller        = &lHW.getNode("controller_id" + id);
+	node_fifo_data         = &lHW.getNode("fifo_id" + id + ".data");
+	node_fifo_occupancy    = &lHW.getNode("fifo_id" + id + ".occupancy");
+	node_fifo_full_counter = &lHW.getNode("fifo_id" + id + ".full_counter");
+	node_fifo_idle_counter = &lHW.getNode("fifo_id" + id + ".counter_timelike");
+	node_fifo_reset        = &lHW.getNode("fifo_id" + id + ".reset");
+	node_mode              = &lHW.getNode("regfile.mode");
+
+	fifo_size = node_fifo_data->getSize();
 }
 
 int ChipIf::spi_transfer(ARCADIA_command command, uint16_t payload, uint32_t* rcv_data){
 
-	const uhal::Node& SPI_CTRL_Node = fpga->lHW.getNode("spi_id" + std::to_string(chip_id) + ".CTRL");
-	const uhal::Node& SPI_TxRx_node = fpga->lHW.getNode("spi_id" + std::to_string(chip_id) + ".TxRx0");
+	// Within a transaction, writes are queued and reads flush the queue
+	if (spi_transaction) {
+		if (rcv_data == NULL) {
+			spi_queue.push_back((command<<20) | payload);
+			return 0;
+		}
+
+		int res = spi_flush();
+		if (res)
+			return res;
+	}
+
+	return spi_send((command<<20) | payload, rcv_data);
+}
+
+int ChipIf::spi_send(uint32_t word, uint32_t* rcv_data){
+	const uhal::Node& SPI_CTRL_Node = *node_spi_ctrl;
+	const uhal::Node& SPI_TxRx_node = *node_spi_txrx;
 
 	// prepare CTRL register
 	SPI_CTRL_Node.write(SPI_ASS | SPI_RX_NEG | SPI_CHAR_LEN);
 
 	// write TX register
-	SPI_TxRx_node.write((command<<20) | payload);
+	SPI_TxRx_node.write(word);
 
 	// set CTRL register to start transfer
 	SPI_CTRL_Node.write(SPI_GO_BUSY | SPI_ASS | SPI_RX_NEG | SPI_CHAR_LEN);
 	fpga->lHW.dispatch();
 
 	// wait done
-	bool done = false;
-	for(int tryes=0; tryes<3; tryes++){
-		uhal::ValWord<uint32_t> CTRL_val = SPI_CTRL_Node.read();
-		fpga->lHW.dispatch();
-
-		done = ((CTRL_val.value() & SPI_GO_BUSY) == 0);
-		if (done)
-			break;
-	}
-
-	if(!done){
+	if(!spi_wait_done()){
 		std::cout << "Timeout on SPI xfer" << std::endl;
 		return -1;
 	}
@@ -90,6 +247,118 @@ int ChipIf::spi_transfer(ARCADIA_command command, uint16_t payload, uint32_t* rc
 	return 0;
 }
 
+bool ChipIf::spi_wait_done() {
+	for(int tryes=0; tryes<3; tryes++){
+		uhal::ValWord<uint32_t> CTRL_val = node_spi_ctrl->read();
+		fpga->lHW.dispatch();
+
+		if ((CTRL_val.value() & SPI_GO_BUSY) == 0)
+			return true;
+	}
+
+	return false;
+}
+
+void ChipIf::spi_transaction_begin() {
+	spi_transaction = true;
+}
+
+int ChipIf::spi_transaction_end() {
+	int res = spi_flush();
+	spi_transaction = false;
+
+	return res;
+}
+
+/*
+ * Sends the queued SPI writes with as few dispatches as possible. Each
+ * transfer is followed by spi_poll_reads reads of the CTRL register, which
+ * give it time to complete before the next one is queued, and whose last
+ * value tells whether it did.
+ *
+ * If a transfer was still busy, the following one has been ignored by the
+ * SPI core, while any later one may have run or not. GCR pointer and data
+ * writes can be repeated: they are sent again one at a time, waiting for
+ * the core to be idle before each, starting from the pointer write of the
+ * ignored transfer. Other commands may have run already, and must not run
+ * twice: they are dropped, and the flush fails.
+ */
+int ChipIf::spi_flush() {
+	std::vector<uhal::ValWord<uint32_t>> status;
+	status.reserve(spi_queue.size());
+
+	for (size_t i = 0; i < spi_queue.size(); i++) {
+		node_spi_ctrl->write(SPI_ASS | SPI_RX_NEG | SPI_CHAR_LEN);
+		node_spi_txrx->write(spi_queue[i]);
+		node_spi_ctrl->write(SPI_GO_BUSY | SPI_ASS | SPI_RX_NEG | SPI_CHAR_LEN);
+
+		uhal::ValWord<uint32_t> CTRL_val = node_spi_ctrl->read();
+		for (uint32_t poll = 1; poll < spi_poll_reads; poll++)
+			CTRL_val = node_spi_ctrl->read();
+
+		status.push_back(CTRL_val);
+	}
+
+	if (!spi_queue.empty())
+		fpga->lHW.dispatch();
+
+	// Every transfer followed by another one must have completed
+	size_t ignored = 1;
+	while (ignored < status.size() && (status[ignored-1].value() & SPI_GO_BUSY) == 0)
+		ignored++;
+
+	if (ignored >= status.size()) {
+		spi_queue.clear();
+
+		if (!status.empty() && (status.back().value() & SPI_GO_BUSY) && !spi_wait_done()) {
+			std::cout << "Timeout on SPI xfer" << std::endl;
+			invalidate_gcr_cache();
+			return -1;
+		}
+
+		return 0;
+	}
+
+	if (!spi_wait_done()) {
+		std::cout << "Timeout on SPI xfer" << std::endl;
+		spi_queue.clear();
+		invalidate_gcr_cache();
+		return -1;
+	}
+
+	// Data writes go to the pointer set before them
+	size_t resume = ignored;
+	if ((spi_queue[resume] >> 20) == ARCADIA_WR_DATA && (spi_queue[resume-1] >> 20) == ARCADIA_WR_PNTR)
+		resume--;
+
+	size_t unknown = 0;
+	int res = 0;
+	for (size_t i = resume; i < spi_queue.size() && res == 0; i++) {
+		uint32_t command = spi_queue[i] >> 20;
+		bool repeatable = (command == ARCADIA_WR_PNTR || command == ARCADIA_WR_DATA);
+
+		if (i > ignored && !repeatable) {
+			unknown++;
+			continue;
+		}
+
+		res = spi_send(spi_queue[i], NULL);
+	}
+
+	spi_queue.clear();
+
+	if (unknown) {
+		std::cerr << "SPI core busy: " << unknown << " queued commands may not have been executed" << std::endl;
+		res = -1;
+	}
+
+	// The shadow registers of the queued GCR writes can't be trusted
+	if (res)
+		invalidate_gcr_cache();
+
+	return res;
+}
+
 int ChipIf::read_gcr(uint16_t addr, uint16_t* data, bool force_update){
 	if (spi_unavailable)
 		return -1;
@@ -112,6 +381,7 @@ int ChipIf::read_gcr(uint16_t addr, uint16_t* data, bool force_update){
 		}
 
 		GCR_address_array[addr] = (reg_data&0xffff);
+		GCR_valid[addr] = true;
 	}
 
 	if (data != NULL)
@@ -121,15 +391,21 @@ int ChipIf::read_gcr(uint16_t addr, uint16_t* data, bool force_update){
 }
 
 
-int ChipIf::write_gcr(uint16_t addr, uint16_t data) {
+int ChipIf::write_gcr(uint16_t addr, uint16_t data, bool force) {
 	if (spi_unavailable)
 		return -1;
 
-	if (addr > GCR_address_array.size()){
+	if (addr >= GCR_address_array.size()){
 		std::cerr << "Invalid address" << std::endl;
 		return -1;
 	}
 
+	// Skip writes not changing the shadow register, if known to match the chip
+	if (gcr_write_changed_only && !force && GCR_valid[addr] && GCR_address_array[addr] == data) {
+		gcr_writes_suppressed++;
+		return 0;
+	}
+
 	int gcr_address = addr | 0x2000;
 	int res;
 
@@ -147,11 +423,16 @@ int ChipIf::write_gcr(uint16_t addr, uint16_t data) {
 
 	// update cached value
 	GCR_address_array[addr] = data;
+	GCR_valid[addr] = true;
 
 	return res;
 }
 
-int ChipIf::write_gcrpar(std::string gcrpar, uint16_t value) {
+void ChipIf::invalidate_gcr_cache() {
+	std::fill(GCR_valid.begin(), GCR_valid.end(), false);
+}
+
+int ChipIf::write_gcrpar(std::string gcrpar, uint16_t value, bool force) {
 	if (spi_unavailable)
 		return -1;
 
@@ -170,7 +451,7 @@ int ChipIf::write_gcrpar(std::string gcrpar, uint16_t value) {
 	// set parameter bits
 	reg_data |= ((value & param.mask) << param.offset);
 	// write
-	int res = write_gcr(param.word_address, reg_data);
+	int res = write_gcr(param.word_address, reg_data, force);
 
 	//std::cout << "write gcr: " << std::dec << param.word_address << " val: 0x" << std::hex << reg_data << std::endl;
 
@@ -216,7 +497,7 @@ int ChipIf::reinitialize_gcr(uint16_t addr) {
 
 	}
 
-	int res = write_gcr(addr, reg_value);
+	int res = write_gcr(addr, reg_value, true);
 	return res;
 }
 
@@ -293,14 +574,15 @@ int ChipIf::send_controller_command(const std::string cmd, uint32_t arg, uint32_
 
 	uint32_t command = (param.word_address<<20) | ctrl_address_array[param.word_address];
 
-	fpga->write_register("controller_id" + std::to_string(chip_id), command);
+	node_controller->write(command);
+	fpga->lHW.dispatch();
 
 	// always read response to free fifo
-	uint32_t value;
-	fpga->read_register("controller_id" + std::to_string(chip_id), &value);
+	uhal::ValWord<uint32_t> value = node_controller->read();
+	fpga->lHW.dispatch();
 
 	if (resp)
-		*resp = value;
+		*resp = value.value();
 
 	return 0;
 }
@@ -319,51 +601,139 @@ int ChipIf::send_pulse(uint32_t t_on, uint32_t t_off, uint32_t tp_number) {
 	return 0;
 }
 
-size_t ChipIf::fifo_read(size_t num_packets) {
-	uint32_t packets_fifo = fifo_count();
-
-	if (packets_fifo == 0)
+size_t ChipIf::fifo_read_size(uint32_t packets_fifo, size_t num_packets, bool to_ring) {
+	if (to_ring && ring->available() == 0) {
+		// Leave packets in the FPGA FIFO until the consumer catches up
+		stats.ring_full_stalls++;
+		std::this_thread::sleep_for(std::chrono::microseconds(100));
 		return -1;
+	}
 
-	if (packets_write->size() > max_packets) {
+	if (!to_ring && packets_write->size() > max_packets) {
 		//std::cerr << "Currently reached maximum packets. Unable to read " << std::dec << packets_fifo << " packets from FPGA." << std::endl;
+		stats.max_packets_stalls++;
 		sleep(0.1);
 		return -1;
 	}
 
-	const uhal::Node& Node_fifo_data = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".data");
-
 	uint32_t packets_to_read;
-	if(num_packets) {
+	if (to_ring) {
+		packets_to_read = std::min<size_t>(packets_fifo, ring->available());
+		if (num_packets && packets_to_read > num_packets)
+			packets_to_read = num_packets;
+	} else if(num_packets) {
 		packets_to_read = num_packets - packets_write->size();
 		if(packets_to_read > packets_fifo)
 			packets_to_read = packets_fifo;
 	} else
 		packets_to_read = packets_fifo;
 
-	uint32_t bytes_to_read = packets_to_read*2;
-	uhal::ValVector<uint32_t> data = Node_fifo_data.readBlock(bytes_to_read);
-	fpga->lHW.dispatch();
+	return packets_to_read;
+}
 
+size_t ChipIf::fifo_store(const uhal::ValVector<uint32_t>& data, uint32_t bytes_to_read, bool to_ring) {
 	uint32_t bytes_read = data.size();
 
-	if(packets_to_read == 0)
-		return 0;
-
 	if (bytes_read < bytes_to_read){
+		stats.short_reads++;
 		std::cerr << "Read " << bytes_read << " from FIFO, instead of the requested " << bytes_to_read << std::endl;
 		return -1;
 	}
 
-	for (size_t index = 0; index < bytes_read-1; index += 2) {
-		uint64_t p = data[index];
-		p = (p << 32) | data[index+1];
-		packets_write->push_back( p );
+	bool record = record_flag;
+	if (record)
+		record_buffer.resize(bytes_read/2);
+
+	if (to_ring) {
+		for (size_t index = 0; index < bytes_read-1; index += 2) {
+			uint64_t p = data[index];
+			p = (p << 32) | data[index+1];
+			ring->write(index/2, p);
+
+			if (record)
+				record_buffer[index/2] = p;
+		}
+
+		ring->commit(bytes_read/2);
+	} else {
+		for (size_t index = 0; index < bytes_read-1; index += 2) {
+			uint64_t p = data[index];
+			p = (p << 32) | data[index+1];
+			packets_write->push_back( p );
+
+			if (record)
+				record_buffer[index/2] = p;
+		}
 	}
 
+	if (record)
+		record_write(record_buffer.data(), bytes_read/2);
+
+	stats.blocks_read++;
+	stats.packets_read += bytes_read/2;
+	stats.bytes_read += bytes_read*sizeof(uint32_t);
+
 	return bytes_read/2;
 }
 
+size_t ChipIf::fifo_read(size_t num_packets) {
+	if (pipelined_read && run_flag)
+		return fifo_read_pipelined(num_packets);
+
+	uint32_t packets_fifo = fifo_count();
+
+	if (packets_fifo == 0) {
+		stats.empty_polls++;
+		return -1;
+	}
+
+	// While the reader thread runs in ring mode, packets go to the ring
+	bool to_ring = run_flag && ring;
+
+	size_t packets_to_read = fifo_read_size(packets_fifo, num_packets, to_ring);
+	if (packets_to_read == (size_t) -1)
+		return -1;
+
+	uint32_t bytes_to_read = packets_to_read*2;
+	uhal::ValVector<uint32_t> data = node_fifo_data->readBlock(bytes_to_read);
+	fifo_dispatch();
+
+	if(packets_to_read == 0)
+		return 0;
+
+	return fifo_store(data, bytes_to_read, to_ring);
+}
+
+/*
+ * Reads the packets known to be in the FIFO from the previous dispatch,
+ * and queues the next occupancy read in the same dispatch. The occupancy
+ * is read after the block, so it only accounts for packets not read yet.
+ */
+size_t ChipIf::fifo_read_pipelined(size_t num_packets) {
+	bool to_ring = run_flag && ring;
+
+	size_t packets_to_read = 0;
+	if (fifo_pending != 0)
+		packets_to_read = fifo_read_size(fifo_pending, num_packets, to_ring);
+
+	if (packets_to_read == 0 || packets_to_read == (size_t) -1) {
+		if (fifo_pending == 0)
+			stats.empty_polls++;
+
+		fifo_pending = fifo_count();
+		return -1;
+	}
+
+	uint32_t bytes_to_read = packets_to_read*2;
+	uhal::ValVector<uint32_t> data = node_fifo_data->readBlock(bytes_to_read);
+	uhal::ValWord<uint32_t> fifo_occupancy = node_fifo_occupancy->read();
+	fifo_dispatch();
+
+	fifo_pending = occupancy_packets(fifo_occupancy.value());
+
+	return fifo_store(data, bytes_to_read, to_ring);
+}
+
 void ChipIf::fifo_read_loop() {
 	std::chrono::steady_clock::time_point start_time = std::chrono::steady_clock::now();
 	std::chrono::steady_clock::time_point idle_start_time = start_time;
@@ -397,10 +767,17 @@ void ChipIf::fifo_read_loop() {
 		size_t packets_to_read = (stop_after) ? stop_after - total_packets : 0;
 
 		idle_start_time = std::chrono::steady_clock::now();
-		fifo_read(packets_to_read);
+		size_t packets_read = fifo_read(packets_to_read);
+		stats.loop_iterations++;
+
+		// The ring is drained concurrently, count packets as they are read
+		if (ring && packets_read != (size_t) -1)
+			total_packets += packets_read;
+
+		size_t packets_stored = (ring) ? total_packets : packets_write->size();
 
 		// stop if maxpkg found
-		if (stop_after != 0 && packets_write->size() >= stop_after)
+		if (stop_after != 0 && packets_stored >= stop_after)
 			run_flag = false;
 	}
 }
@@ -410,10 +787,19 @@ void ChipIf::fifo_read_start() {
 	if (run_flag == true)
 		return;
 
-	packets_write->reserve(max_packets/2);
+	if (ring_size == 0)
+		ring.reset();
+	else if (!ring || ring->capacity() < ring_size)
+		ring.reset(new PacketRing(ring_size));
+
+	if (ring)
+		ring->clear();
+	else
+		packets_write->reserve(max_packets/2);
 
 	packets_reset();
 
+	fifo_pending = 0;
 	run_flag = true;
 	dataread_thread = std::thread(&ChipIf::fifo_read_loop, this);
 }
@@ -427,24 +813,36 @@ void ChipIf::fifo_read_stop() {
 }
 
 uint32_t ChipIf::fifo_count() {
-	const uhal::Node& Node_fifo_data = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".data");
-	const uhal::Node& Node_fifo_occupancy = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".occupancy");
-	uhal::ValWord<uint32_t> fifo_occupancy = Node_fifo_occupancy.read();
-	fpga->lHW.dispatch();
-	uint32_t occupancy = (fifo_occupancy.value() & 0x1ffff);
+	uhal::ValWord<uint32_t> fifo_occupancy = node_fifo_occupancy->read();
+	fifo_dispatch();
+
+	return occupancy_packets(fifo_occupancy.value());
+}
+
+uint32_t ChipIf::occupancy_packets(uint32_t value) {
+	uint32_t occupancy = (value & 0x1ffff);
 	
-	if (occupancy > Node_fifo_data.getSize())
+	if (occupancy > fifo_size)
 		throw std::runtime_error("DAQ board returned an invalid fifo occupancy value of " + std::to_string(occupancy) + "(> fifo size)");
 
 	if (occupancy % 2)
 		throw std::runtime_error("DAQ board returned an invalid fifo occupancy value of " + std::to_string(occupancy) + " (odd instead of even)");
 
+	stats.record_occupancy(occupancy/2);
+
 	return (uint32_t) occupancy/2;
 }
 
+void ChipIf::fifo_dispatch() {
+	std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+	fpga->lHW.dispatch();
+
+	stats.record_dispatch(
+		std::chrono::duration_cast<std::chrono::microseconds>(std::chrono::steady_clock::now()-start).count());
+}
+
 uint32_t ChipIf::fifo_overflow_count() {
-	const uhal::Node& Node_fifo_fullcounter = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".full_counter");
-	uhal::ValWord<uint32_t> fifo_fullcounter = Node_fifo_fullcounter.read();
+	uhal::ValWord<uint32_t> fifo_fullcounter = node_fifo_full_counter->read();
 	fpga->lHW.dispatch();
 	uint32_t full_counter = fifo_fullcounter.value();
 	
@@ -452,8 +850,7 @@ uint32_t ChipIf::fifo_overflow_count() {
 }
 
 uint32_t ChipIf::fifo_idle_count() {
-	const uhal::Node& Node_fifo_idlecounter = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".counter_timelike");
-	uhal::ValWord<uint32_t> fifo_idlecounter = Node_fifo_idlecounter.read();
+	uhal::ValWord<uint32_t> fifo_idlecounter = node_fifo_idle_counter->read();
 	fpga->lHW.dispatch();
 	uint32_t idlecounter = fifo_idlecounter.value();
 	
@@ -461,10 +858,9 @@ uint32_t ChipIf::fifo_idle_count() {
 }
 
 void ChipIf::fifo_overflow_counter_reset() {
-	const uhal::Node& node_fifo_reset = fpga->lHW.getNode("regfile.mode");
-	node_fifo_reset.write(0xffff);
+	node_mode->write(0xffff);
 	fpga->lHW.dispatch();
-	node_fifo_reset.write(0x0000);
+	node_mode->write(0x0000);
 	fpga->lHW.dispatch();
 }
 
@@ -474,8 +870,7 @@ int ChipIf::fifo_reset() {
 		return -1;
 	}
 
-	const uhal::Node& node_fifo_reset = fpga->lHW.getNode("fifo_id" + std::to_string(chip_id) + ".reset");
-	node_fifo_reset.write(0xffffffff);
+	node_fifo_reset->write(0xffffffff);
 	fpga->lHW.dispatch();
 
 	//std::cout << chip_id << " : reset sent" << std::endl;
@@ -591,7 +986,10 @@ uint32_t ChipIf::calibrate_deserializers(bool verbose) {
 }
 
 void ChipIf::packets_reset() {
-	if(run_flag)
+	if(run_flag && ring)
+		ring->clear();
+
+	else if(run_flag)
 		packets_write->clear();
 
 	else
@@ -614,6 +1012,9 @@ bool ChipIf::packets_read_active() {
 }
 
 uint32_t ChipIf::packets_count() {
+	if(run_flag && ring)
+		return ring->size();
+
 	if(run_flag)
 		return packets_write->size();
 	else
@@ -621,6 +1022,12 @@ uint32_t ChipIf::packets_count() {
 }
 
 std::vector<uint64_t>* ChipIf::packets_read(size_t packets = 0) {
+	// Ring mode: drain without stopping the reader thread
+	if(ring && (run_flag || ring->size() > 0)) {
+		ring->pop(&packets_drain, packets);
+		return &packets_drain;
+	}
+
 	if(run_flag) {
 		fifo_read_stop();
 
@@ -641,6 +1048,81 @@ std::vector<uint64_t>* ChipIf::packets_read(size_t packets = 0) {
 	return packets_write;
 }
 
+/*
+ * Raw packets recording. The file starts with a header, little endian:
+ *
+ *   char[8]  magic, "ARCADIAR"
+ *   uint32   version
+ *   uint32   header size, in bytes, multiple of 8
+ *   uint32   chip id
+ *   uint32   number of GCRs
+ *   double   timestamp resolution, in seconds, 0 if unknown
+ *   uint64   start time, in ns since the epoch
+ *   uint16[] GCRs, padded to the header size
+ *
+ * followed by the 64-bit packets, as read from the FPGA FIFO.
+ */
+int ChipIf::record_start(std::string path, double ts_resolution) {
+	std::lock_guard<std::mutex> lock(record_mutex);
+
+	record_flag = false;
+	if (record_file.is_open())
+		record_file.close();
+
+	record_file.open(path, std::ios::binary | std::ios::trunc);
+	if (!record_file.is_open()) {
+		std::cerr << "Unable to open " << path << " for recording" << std::endl;
+		return -1;
+	}
+
+	uint32_t version = RECORDING_VERSION;
+	uint32_t id = chip_id;
+	uint32_t gcr_count = GCR_address_array.size();
+	uint32_t header_size = 40 + ((2*gcr_count + 7) & ~7);
+	uint64_t start_time = std::chrono::duration_cast<std::chrono::nanoseconds>(
+		std::chrono::system_clock::now().time_since_epoch()).count();
+
+	record_file.write(RECORDING_MAGIC, 8);
+	record_file.write(reinterpret_cast<const char*>(&version), sizeof(version));
+	record_file.write(reinterpret_cast<const char*>(&header_size), sizeof(header_size));
+	record_file.write(reinterpret_cast<const char*>(&id), sizeof(id));
+	record_file.write(reinterpret_cast<const char*>(&gcr_count), sizeof(gcr_count));
+	record_file.write(reinterpret_cast<const char*>(&ts_resolution), sizeof(ts_resolution));
+	record_file.write(reinterpret_cast<const char*>(&start_time), sizeof(start_time));
+	record_file.write(reinterpret_cast<const char*>(GCR_address_array.data()), 2*gcr_count);
+
+	std::vector<char> padding(header_size - 40 - 2*gcr_count, 0);
+	record_file.write(padding.data(), padding.size());
+
+	packets_recorded = 0;
+	record_flag = true;
+
+	return 0;
+}
+
+void ChipIf::record_write(const uint64_t* packets, size_t count) {
+	std::lock_guard<std::mutex> lock(record_mutex);
+
+	// Stopped while the block was being read
+	if (!record_file.is_open())
+		return;
+
+	record_file.write(reinterpret_cast<const char*>(packets), count*sizeof(uint64_t));
+	packets_recorded += count;
+}
+
+void ChipIf::record_stop() {
+	std::lock_guard<std::mutex> lock(record_mutex);
+
+	record_flag = false;
+	if (record_file.is_open())
+		record_file.close();
+}
+
+bool ChipIf::recording() {
+	return record_flag;
+}
+
 /*
  * FPGA If
  */
@@ -5,8 +5,13 @@
 #include <string>
 #include <thread>
 #include <atomic>
+#include <mutex>
+#include <fstream>
 #include <map>
 #include <list>
+#include <memory>
+#include <array>
+#include <vector>
 
 #include "uhal/uhal.hpp"
 
@@ -174,6 +179,66 @@ inline uint32_t calc_cmd_max_addr(){
 	return (addr_max+1);
 }
 
+/*
+ * Single-producer/single-consumer packets ring buffer. The FIFO reader
+ * thread writes and publishes packets, while the consumer drains them
+ * concurrently without locks.
+ */
+class PacketRing {
+private:
+	std::vector<uint64_t> buffer;
+	size_t mask;
+
+	std::atomic<size_t> head;
+	std::atomic<size_t> tail;
+
+public:
+	PacketRing(size_t min_capacity);
+
+	size_t capacity() const { return buffer.size(); }
+	size_t size() const;
+	size_t available() const;
+
+	// Producer side
+	void write(size_t offset, uint64_t packet);
+	void commit(size_t count);
+
+	// Consumer side
+	size_t pop(std::vector<uint64_t>* packets, size_t max_packets);
+	void clear();
+};
+
+/*
+ * Statistics of the FIFO reader, updated by the reader thread and read
+ * concurrently. Dispatch latencies are binned in powers of two of us:
+ * bucket 0 counts dispatches shorter than 1 us, bucket i those in
+ * [2^(i-1), 2^i) us, and the last one all the longer ones.
+ */
+struct FifoStats {
+	static const size_t latency_buckets = 24;
+
+	std::atomic<uint64_t> loop_iterations;
+	std::atomic<uint64_t> empty_polls;
+	std::atomic<uint64_t> blocks_read;
+	std::atomic<uint64_t> packets_read;
+	std::atomic<uint64_t> bytes_read;
+	std::atomic<uint64_t> short_reads;
+	std::atomic<uint64_t> max_occupancy;
+	std::atomic<uint64_t> max_packets_stalls;
+	std::atomic<uint64_t> ring_full_stalls;
+	std::atomic<uint64_t> dispatches;
+	std::atomic<uint64_t> dispatch_time_us;
+	std::array<std::atomic<uint64_t>, latency_buckets> dispatch_latency;
+
+	FifoStats() { reset(); }
+
+	void reset();
+	void record_dispatch(uint64_t latency_us);
+	void record_occupancy(uint64_t occupancy);
+	std::map<std::string, uint64_t> counters() const;
+	std::vector<uint64_t> latency_histogram() const;
+};
+
 class FPGAIf;
 
 class ChipIf {
@@ -188,6 +253,7 @@ private:
 	bool spi_unavailable;
 
 	std::vector<uint16_t> GCR_address_array;
+	std::vector<bool> GCR_valid;
 	std::vector<uint32_t> ctrl_address_array;
 
 	std::vector<uint64_t> packetsA;
@@ -195,13 +261,51 @@ private:
 
 	std::vector<uint64_t> *packets_write;
 
+	// uhal nodes, resolved once at construction
+	const uhal::Node* node_spi_ctrl;
+	const uhal::Node* node_spi_txrx;
+	const uhal::Node* node_controller;
+	const uhal::Node* node_fifo_data;
+	const uhal::Node* node_fifo_occupancy;
+	const uhal::Node* node_fifo_full_counter;
+	const uhal::Node* node_fifo_idle_counter;
+	const uhal::Node* node_fifo_reset;
+	const uhal::Node* node_mode;
+	uint32_t fifo_size;
+
+	void resolve_nodes();
+
+	std::unique_ptr<PacketRing> ring;
+	std::vector<uint64_t> packets_drain;
+
+	// Raw packets recording
+	std::atomic_bool record_flag;
+	std::mutex record_mutex;
+	std::ofstream record_file;
+	std::vector<uint64_t> record_buffer;
+	void record_write(const uint64_t* packets, size_t count);
+
 	// FPGA FIFO Management
 	int fifo_reset();
+	uint32_t fifo_pending;
+
+	// SPI transactions
+	bool spi_transaction;
+	std::vector<uint32_t> spi_queue;
+	bool spi_wait_done();
+	int spi_send(uint32_t word, uint32_t* rcv_data);
+	int spi_flush();
+
 	size_t fifo_read(size_t num_packets);
+	size_t fifo_read_pipelined(size_t num_packets);
+	size_t fifo_read_size(uint32_t packets_fifo, size_t num_packets, bool to_ring);
+	size_t fifo_store(const uhal::ValVector<uint32_t>& data, uint32_t bytes_to_read, bool to_ring);
 	void fifo_read_start();
 	void fifo_read_loop();
 	void fifo_read_stop();
 	uint32_t fifo_count();
+	uint32_t occupancy_packets(uint32_t value);
+	void fifo_dispatch();
 
 public:
 	ChipIf(uint8_t id, FPGAIf *fpga_ptr);
@@ -209,6 +313,9 @@ public:
 	std::thread dataread_thread;
 
 	size_t max_packets;
+	size_t ring_size;
+	bool pipelined_read;
+	uint32_t spi_poll_reads;
 	size_t stop_after;
 	uint32_t timeout;
 	uint32_t idle_timeout;
@@ -220,6 +327,8 @@ public:
 
 	// Base I/O
 	int spi_transfer(ARCADIA_command command, uint16_t payload, uint32_t* rcv_data);
+	void spi_transaction_begin();
+	int spi_transaction_end();
 	int send_pulse(uint32_t t_on, uint32_t t_off, uint32_t tp_number);
 
 	// Chip Configuration
@@ -227,9 +336,14 @@ public:
 	int read_gcrpar(std::string gcrpar, uint16_t* value, bool force_update = true);
 	int check_gcr_consistency();
 
-	int write_gcr(uint16_t addr, uint16_t data);
-	int write_gcrpar(std::string gcrpar, uint16_t value);
+	int write_gcr(uint16_t addr, uint16_t data, bool force = false);
+	int write_gcrpar(std::string gcrpar, uint16_t value, bool force = false);
 	int reinitialize_gcr(uint16_t addr);
+	void invalidate_gcr_cache();
+
+	// Shadow registers
+	bool gcr_write_changed_only;
+	uint64_t gcr_writes_suppressed;
 
 	int write_icr(std::string icr_reg, uint16_t data);
 
@@ -238,6 +352,9 @@ public:
 	uint32_t fifo_idle_count();
 	void fifo_overflow_counter_reset();
 
+	// FIFO reader statistics
+	FifoStats stats;
+
 	// SW FIFO Management
 	void packets_reset();
 	void packets_read_start();
@@ -245,6 +362,12 @@ public:
 	bool packets_read_active();
 	uint32_t packets_count();
 	std::vector<uint64_t>* packets_read(size_t packets);
+
+	// Raw packets recording
+	uint64_t packets_recorded;
+	int record_start(std::string path, double ts_resolution = 0);
+	void record_stop();
+	bool recording();
 };
 
 class FPGAIf {
@@ -67,6 +67,11 @@ PYBIND11_MODULE(arcadia_daq, m) {
 
 	py::class_<ChipIf>(m, "ChipIf")
 		.def_readwrite("max_packets", &ChipIf::max_packets)
+		.def_readwrite("ring_size", &ChipIf::ring_size)
+		.def_readwrite("pipelined_read", &ChipIf::pipelined_read)
+		.def_readwrite("spi_poll_reads", &ChipIf::spi_poll_reads)
+		.def_readwrite("gcr_write_changed_only", &ChipIf::gcr_write_changed_only)
+		.def_readonly("gcr_writes_suppressed", &ChipIf::gcr_writes_suppressed)
 		.def_readwrite("timeout", &ChipIf::timeout)
 		.def_readwrite("idle_timeout", &ChipIf::idle_timeout)
 
@@ -76,6 +81,9 @@ PYBIND11_MODULE(arcadia_daq, m) {
 				return py::make_tuple(ret, rcv_data);
 				})
 
+		.def("spi_transaction_begin", &ChipIf::spi_transaction_begin)
+		.def("spi_transaction_end", &ChipIf::spi_transaction_end)
+
 		.def("dump_gcrs", [](ChipIf &chip, bool force_update) {
 				py::dict d;
 
@@ -95,10 +103,11 @@ PYBIND11_MODULE(arcadia_daq, m) {
 				return py::make_tuple(ret, value);
 				})
 
-		.def("write_gcr", &ChipIf::write_gcr)
+		.def("write_gcr", &ChipIf::write_gcr, py::arg("addr"), py::arg("data"), py::arg("force") = false)
 		.def("reinitialize_gcr", &ChipIf::reinitialize_gcr)
+		.def("invalidate_gcr_cache", &ChipIf::invalidate_gcr_cache)
 		.def("write_icr", &ChipIf::write_icr)
-		.def("write_gcrpar", &ChipIf::write_gcrpar)
+		.def("write_gcrpar", &ChipIf::write_gcrpar, py::arg("gcrpar"), py::arg("value"), py::arg("force") = false)
 
 		.def("read_gcrpar", [](ChipIf &chip, std::string gcrpar, bool force_update) {
 				uint16_t value;
@@ -141,6 +150,30 @@ PYBIND11_MODULE(arcadia_daq, m) {
 		.def("fifo_idle_count", &ChipIf::fifo_idle_count)
 		.def("fifo_overflow_counter_reset", &ChipIf::fifo_overflow_counter_reset)
 
+		// FIFO reader statistics
+		.def("stats", [](ChipIf &chip) {
+				py::dict d;
+
+				for(auto const& counter: chip.stats.counters())
+					d[pybind11::cast(counter.first)] = counter.second;
+
+				py::list histogram;
+				for(auto const& count: chip.stats.latency_histogram())
+					histogram.append(count);
+
+				d["dispatch_latency_us"] = histogram;
+				return d;
+				})
+		.def("stats_reset", [](ChipIf &chip) {
+				chip.stats.reset();
+				})
+
+		// Raw packets recording
+		.def("record_start", &ChipIf::record_start, py::arg("path"), py::arg("ts_resolution") = 0)
+		.def("record_stop", &ChipIf::record_stop)
+		.def("recording", &ChipIf::recording)
+		.def_readonly("packets_recorded", &ChipIf::packets_recorded)
+
 		.def("calibrate_deserializers", &ChipIf::calibrate_deserializers);
 
 	m.def("set_ipbus_loglevel", &set_ipbus_loglevel);
@@ -53,6 +53,10 @@ int main(int argc, char** argv){
 			cxxopts::value<uint32_t>()->default_value("0"))
 		("daq-mode",  "value of daq mode register to set after starting the daq",
 			cxxopts::value<uint16_t>()->default_value("0"))
+		("record",    "Record the packets read by the DAQ to [file], suffixed by the chip id if reading more chips",
+			cxxopts::value<std::string>())
+		("ts-res",    "Timestamp resolution in seconds, stored in the recording header",
+			cxxopts::value<double>()->default_value("0"))
 		("controller", "select arcadia_controller register",
 			cxxopts::value<std::string>())
 		("v,verbose",  "Verbose output, can be specified multiple times")
@@ -206,6 +210,24 @@ int main(int argc, char** argv){
 		auto maxtime = cxxopts_res["maxtime"].as<uint32_t>();
 		auto maxidle = cxxopts_res["maxidle"].as<uint32_t>();
 
+		bool record = cxxopts_res.count("record");
+		auto ts_res = cxxopts_res["ts-res"].as<double>();
+
+		if (record) {
+			for(auto chipid: chipid_list) {
+				std::string path = cxxopts_res["record"].as<std::string>();
+				if (chipid_list.size() > 1)
+					path += "_id" + std::to_string(chipid);
+
+				if (fpga.chips[chipid]->record_start(path, ts_res) != 0)
+					return -1;
+
+				// Packets are only kept in the file: read through a ring, drained below
+				fpga.chips[chipid]->ring_size = 1 << 20;
+				std::cout << "recording chip " << std::dec << (int) chipid << " in " << path << std::endl;
+			}
+		}
+
 		std::cout << "starting DAQ, Ctrl-C to stop..." << std::endl;
 
 		for(auto chipid: chipid_list) {
@@ -220,11 +242,37 @@ int main(int argc, char** argv){
 			fpga.write_register("regfile.mode", daq_mode);
 		}
 
+		if (record) {
+			bool active = true;
+			while (active) {
+				active = false;
+				for(auto chipid: chipid_list) {
+					// Discard the packets, already recorded: only drain the ring of running readers
+					if (!fpga.chips[chipid]->packets_read_active())
+						continue;
+
+					active = true;
+					if (fpga.chips[chipid]->packets_count() > 0)
+						fpga.chips[chipid]->packets_read(0);
+				}
+
+				usleep(1000);
+			}
+		}
+
 		for(auto chipid: chipid_list)
 			fpga.chips[chipid]->dataread_thread.join();
 
 		if (daq_mode != 0)
 			fpga.write_register("regfile.mode", 0x0);
+
+		if (record) {
+			for(auto chipid: chipid_list) {
+				fpga.chips[chipid]->record_stop();
+				std::cout << "chip " << std::dec << (int) chipid << ": recorded "
+					<< fpga.chips[chipid]->packets_recorded << " packets" << std::endl;
+			}
+		}
 	}
 
 	return 0;